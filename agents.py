@@ -0,0 +1,244 @@
+"""
+Streamlit-free agents and tools, shared by the web app (study_buddy_agent.py) and the
+command-line tools (question_bank_cli.py). Nothing here touches st.session_state.
+"""
+import difflib
+import json
+import logging
+
+from llm_gateway import ModelGateway
+from pdf_pipeline import PDFPipeline, file_sha256
+
+_gateway_factory = None
+_gateway = None
+
+
+def set_default_gateway(factory):
+    """`factory()` supplies the gateway for agents built without one (the app passes its cached gateway)."""
+    global _gateway_factory
+    _gateway_factory = factory
+
+
+def default_gateway():
+    global _gateway
+    if _gateway_factory is not None:
+        return _gateway_factory()
+    if _gateway is None:
+        _gateway = ModelGateway()
+    return _gateway
+
+
+class BaseAgent:
+    """Common plumbing: every agent talks to Gemini through the shared ModelGateway (see set_default_gateway)."""
+    CACHE_RESPONSES = True  # Identical prompts are answered from the cache; opt out per agent
+    TIMEOUT_SECONDS = 60  # deadline per call, retries included
+
+    def __init__(self, gateway=None):
+        self.gateway = gateway or default_gateway()
+
+    def ask(self, prompt):
+        return self.gateway.generate(prompt, agent=type(self).__name__, use_cache=self.CACHE_RESPONSES,
+                                     timeout=self.TIMEOUT_SECONDS).strip()
+
+    def ask_stream(self, prompt):
+        return self.gateway.generate_stream(prompt, agent=type(self).__name__, use_cache=self.CACHE_RESPONSES,
+                                            timeout=self.TIMEOUT_SECONDS)
+
+
+class DocumentIngestionTool:
+    """
+    Extracts PDF text through the multi-process, SHA-256 cached PDFPipeline.
+    Files whose hash is in `known_hashes` (already in the DocumentStore) are skipped.
+    """
+
+    def __init__(self, pipeline=None):
+        self.pipeline = pipeline or PDFPipeline()
+        self.reports = []
+
+    def process_files(self, uploaded_files, known_hashes=(), on_page=None):
+        """
+        Returns the newly extracted files as [{"name", "sha256", "pages": [(page_no, text), ...]}].
+        `on_page(file_name, page_no, total)` streams progress; per-file reports land in self.reports.
+        """
+        documents = []
+        self.reports = []
+        for file in uploaded_files:
+            data = file.getvalue() if hasattr(file, "getvalue") else file.read()
+            if file_sha256(data) in known_hashes:
+                logging.info(f"Skipping already ingested file {file.name}")
+                continue
+            callback = (lambda page_no, total, name=file.name: on_page(name, page_no, total)) if on_page else None
+            pages, report = self.pipeline.extract(file.name, data, on_page=callback)
+            self.reports.append(report)
+            for page_no, err in report.errors:
+                logging.error(f"Ingestion error in {file.name} (page {page_no}): {err}")
+            if sum(len(text) for _, text in pages) > 50:
+                documents.append({"name": file.name, "sha256": report.sha256, "pages": pages})
+            logging.info(f"📄 {report.summary()}")
+        return documents
+
+
+class HybridQA_Agent(BaseAgent):
+    def build_prompt(self, question, context):
+        doc_context = context if context else "No documents uploaded."
+        return f"""
+        KNOWLEDGE BASE: {doc_context}
+        USER QUESTION: {question}
+        TASK: Answer based on KNOWLEDGE BASE. Cite "📘 **[Source: PDF]**" or "🤖 **[Source: AI]**".
+        """
+
+    def answer_question_stream(self, question, context):
+        """Answers from the knowledge base (citing PDF or AI), yielded chunk by chunk as Gemini produces it."""
+        return self.ask_stream(self.build_prompt(question, context))
+
+
+def parse_json_items(text):
+    """
+    Parses a JSON array (or a single object) item by item from model output.
+    Stops at the first item that does not decode, so a truncated tail keeps every complete item.
+    """
+    clean = text.replace("```json", "").replace("```", "").strip()
+    decoder = json.JSONDecoder()
+    start = min([i for i in (clean.find("["), clean.find("{")) if i >= 0], default=-1)
+    if start < 0:
+        return []
+    if clean[start] == "{":
+        try:
+            return [decoder.raw_decode(clean, start)[0]]
+        except json.JSONDecodeError:
+            return []
+    items = []
+    idx = start + 1
+    while idx < len(clean):
+        while idx < len(clean) and clean[idx] in " \t\r\n,":
+            idx += 1
+        if idx >= len(clean) or clean[idx] == "]":
+            break
+        try:
+            item, idx = decoder.raw_decode(clean, idx)
+        except json.JSONDecodeError:
+            logging.warning(f"Stopped parsing questions at offset {idx} (truncated or malformed output)")
+            break
+        items.append(item)
+    return items
+
+
+class ProfessorAgent(BaseAgent):
+    CACHE_RESPONSES = False # Every quiz question should be fresh
+    FORMATS = {"Text-Based": "text", "Multiple Choice (MCQ)": "json"}
+
+    @staticmethod
+    def validate_question(data, fmt):
+        """Schema check + MCQ answer normalization. Returns the cleaned item, or None if unusable."""
+        if not isinstance(data, dict) or not str(data.get("question", "")).strip() or not str(data.get("answer", "")).strip():
+            return None
+        data["question"] = str(data["question"]).strip()
+        if fmt == "text":
+            data["answer"] = str(data["answer"]).strip()
+            return data
+
+        options = [str(opt).strip() for opt in data.get("options") or [] if str(opt).strip()]
+        if len(options) < 2 or len(set(options)) != len(options):
+            return None
+        raw_answer = str(data['answer']).strip()
+        
+        if raw_answer in options:
+            data['answer'] = raw_answer
+        else:
+            matches = difflib.get_close_matches(raw_answer, options, n=1, cutoff=0.8)
+            data['answer'] = matches[0] if matches else options[0]
+        
+        data['options'] = options
+        data.setdefault('explanation', '')
+        return data
+
+    def generate_question(self, context, difficulty, q_type):
+        if q_type == "Text-Based":
+            prompt = f"""
+            SOURCE: {context}
+            TASK: Create a {difficulty} question based on the SOURCE.
+            OUTPUT FORMAT: Valid JSON only.
+            {{
+                "question": "The question text?",
+                "answer": "The concise, correct answer key."
+            }}
+            """
+        elif q_type == "Multiple Choice (MCQ)":
+            prompt = f"""
+            SOURCE: {context}
+            TASK: Create a {difficulty} MCQ based on the SOURCE.
+            
+            OUTPUT FORMAT: Valid JSON only.
+            {{
+                "question": "The question text?",
+                "options": ["Option 1", "Option 2", "Option 3", "Option 4"],
+                "answer": "Option 2",
+                "explanation": "Why this is correct."
+            }}
+            """
+        fmt = self.FORMATS[q_type]
+        items = parse_json_items(self.ask(prompt))
+        data = self.validate_question(items[0], fmt) if items else None
+        if data is None:
+            raise ValueError("ProfessorAgent returned no valid question")
+        return data, fmt
+
+    def generate_questions(self, context, specs):
+        """
+        One LLM call for a whole batch. `specs` is a list of (difficulty, q_type), mixed freely.
+        Returns [(q_data, fmt), ...] for every item that parsed and validated (may be fewer than asked).
+        """
+        wanted = "\n".join(f"{i + 1}. {difficulty} {'MCQ' if self.FORMATS[q_type] == 'json' else 'open (text) question'}"
+                           for i, (difficulty, q_type) in enumerate(specs))
+        prompt = f"""
+        SOURCE: {context}
+        TASK: Create {len(specs)} distinct questions based on the SOURCE, in this order:
+        {wanted}
+        Cover different parts of the SOURCE; do not repeat a question.
+        
+        OUTPUT FORMAT: A valid JSON array only, one object per question.
+        Open question: {{"type": "text", "question": "The question text?", "answer": "The concise, correct answer key."}}
+        MCQ: {{"type": "mcq", "question": "The question text?", "options": ["Option 1", "Option 2", "Option 3", "Option 4"], "answer": "Option 2", "explanation": "Why this is correct."}}
+        """
+        results = []
+        for item in parse_json_items(self.ask(prompt)):
+            kind = item.get("type") if isinstance(item, dict) else None
+            fmt = {"mcq": "json", "text": "text"}.get(kind) or ("json" if isinstance(item, dict) and item.get("options") else "text")
+            data = self.validate_question(item, fmt)
+            if data is None:
+                logging.warning(f"Dropping invalid generated question: {str(item)[:120]}")
+                continue
+            data.pop("type", None)
+            results.append((data, fmt))
+        return results
+
+
+class TutorAgent(BaseAgent):
+    TIMEOUT_SECONDS = 30  # the student is waiting on the hint
+
+    def generate_hint(self, question, context):
+        prompt = f"""
+        SOURCE MATERIAL: {context}
+        QUESTION: {question}
+        TASK: Provide a short, helpful hint without revealing the answer.
+        """
+        return self.ask(prompt)
+
+
+class GraderAgent(BaseAgent):
+    TIMEOUT_SECONDS = 30
+
+    def grade(self, question, user_answer, model_answer, context):
+        prompt = f"""
+        QUESTION: {question}
+        STUDENT ANSWER: {user_answer}
+        CORRECT ANSWER (FROM KEY): {model_answer}
+        SOURCE CONTEXT: {context}
+        
+        TASK: Compare STUDENT ANSWER to CORRECT ANSWER.
+        - Ignore capitalization/punctuation.
+        - If the meaning matches, it is Correct.
+        
+        OUTPUT STRICTLY: IS_CORRECT: [Yes/No] | EXPLANATION: [Short text]
+        """
+        return self.ask(prompt)
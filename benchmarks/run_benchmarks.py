@@ -0,0 +1,354 @@
+"""
+Offline benchmarks for the non-UI hot paths of study_buddy_agent.py.
+
+    python benchmarks/run_benchmarks.py                  # run + compare with benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py --save-baseline  # record a new baseline
+    python benchmarks/run_benchmarks.py --quick --latency 0.01
+
+Gemini is replaced by benchmarks/stub_genai.py (canned JSON, configurable latency), and
+everything runs in a throwaway working directory, so no API key, browser or real session
+files are touched. Exit code 1 means at least one metric regressed past --tolerance.
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.dirname(HERE)
+sys.path.insert(0, REPO)
+sys.path.insert(0, HERE)
+
+import stub_genai  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(HERE, "baseline.json")
+NOISE_FLOOR_SECONDS = 0.002  # differences below this are never reported as regressions
+VOCABULARY = """sample population mean median variance deviation estimator bias interval confidence level
+hypothesis null alternative test statistic p-value significance error type power effect size normal
+distribution binomial poisson uniform probability random variable expected value sampling frame
+undercoverage nonresponse stratified cluster systematic survey experiment control treatment placebo
+regression correlation slope intercept residual outlier leverage chi-square degrees freedom""".split()
+
+
+# --- FIXTURES ---
+def make_pdf(n_pages, lines_per_page=45):
+    """Builds a text PDF in memory (no reportlab needed)."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for p in range(n_pages):
+        heading = f"(11.{p % 9 + 1} Sampling Distribution Section {p + 1}) Tj 0 -14 Td " if p % 10 == 0 else ""
+        rng = random.Random(p)  # distinct but reproducible text per page, so pages do not deduplicate
+        body = " ".join(f"(Page {p + 1} line {i}: {' '.join(rng.choices(VOCABULARY, k=12))}.) Tj 0 -14 Td"
+                        for i in range(lines_per_page))
+        stream = f"BT /F1 9 Tf 36 806 Td {heading}{body} ET".encode()
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects))
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % k for k in kids) + b"] /Count %d >>" % n_pages
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, obj in enumerate(objects):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % (i + 1) + obj + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for off in offsets:
+        out += b"%010d 00000 n \n" % off
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+class FakeUpload(io.BytesIO):
+    """Mimics Streamlit's UploadedFile (name + getvalue)."""
+
+    def __init__(self, name, data):
+        super().__init__(data)
+        self.name = name
+
+
+def make_history(n, chars=400):
+    return [{"role": "user" if i % 2 == 0 else "assistant",
+             "content": f"Message {i} about confidence intervals and p-values. " * (chars // 52)} for i in range(n)]
+
+
+# --- MEASUREMENT ---
+def summarize(durations, units=1):
+    durations = sorted(durations)
+    total = sum(durations)
+
+    def pct(q):
+        return durations[min(len(durations) - 1, int(round(q * (len(durations) - 1))))]
+
+    return {"n": len(durations), "mean": statistics.fmean(durations), "p50": pct(0.50), "p95": pct(0.95),
+            "p99": pct(0.99), "throughput": (len(durations) * units) / total if total else 0.0}
+
+
+def timed(fn, repeat, units=1, warmup=1):
+    """Runs fn `warmup` times untimed (index builds, first-touch caches), then `repeat` timed runs."""
+    for _ in range(warmup):
+        fn()
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    return summarize(durations, units)
+
+
+def peak_memory(fn):
+    """Peak Python allocation (MiB) of a single run, measured separately so tracing does not skew timings."""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    finally:
+        tracemalloc.stop()
+
+
+# --- SCENARIOS ---
+def bench_ingestion(app, pages, repeat):
+    data = make_pdf(pages)
+    counter = {"i": 0}
+
+    def cold():
+        counter["i"] += 1
+        tool = app.DocumentIngestionTool(app.PDFPipeline(cache_dir=f"ingest_cold_{counter['i']}"))
+        assert tool.process_files([FakeUpload("bench.pdf", data)])
+
+    warm_tool = app.DocumentIngestionTool(app.PDFPipeline(cache_dir="ingest_warm"))
+    warm_tool.process_files([FakeUpload("bench.pdf", data)])
+
+    def warm():
+        assert warm_tool.process_files([FakeUpload("bench.pdf", data)])
+
+    return {
+        f"ingest_cold_{pages}p": dict(timed(cold, repeat, units=pages, warmup=0), peak_mib=peak_memory(cold)),
+        f"ingest_cached_{pages}p": dict(timed(warm, repeat * 3, units=pages), peak_mib=peak_memory(warm)),
+    }
+
+
+def bench_study_context(app, st, sizes, repeat):
+    results = {}
+    for n in sizes:
+        st.session_state.chat_history = make_history(n)
+        st.session_state.chat_summary = ""
+        st.session_state.chat_summary_upto = 0
+        st.session_state.summary_job = None
+
+        def call():
+            app.get_study_context(["Uploaded PDF(s)", "My Chat History"], query="What is the central limit theorem?",
+                                  agent="TutorAgent")
+
+        results[f"study_context_{n}msgs"] = dict(timed(call, repeat), peak_mib=peak_memory(call))
+    return results
+
+
+def bench_session_store(app, st, messages, repeat):
+    st.session_state.chat_history = make_history(messages)
+    st.session_state.quiz_history = [{"question": f"Q{i}?", "user_answer": "a", "correct_answer": "b", "feedback": "❌",
+                                      "correct": False, "explanation": "e" * 200} for i in range(messages // 4)]
+    app.SessionManager.save_state()
+    app.SessionManager.flush()
+
+    def save_turn():
+        st.session_state.chat_history.append({"role": "user", "content": "One more question about standard error?"})
+        st.session_state.score += 1
+        app.SessionManager.save_state()
+        app.SessionManager.flush()
+
+    def load():
+        for key in ("score", "chat_history", "quiz_history", "agent_metrics", "chat_summary"):
+            st.session_state.pop(key, None)
+        app.SessionManager.load_state()
+
+    return {
+        f"session_save_turn_{messages}msgs": dict(timed(save_turn, repeat), peak_mib=peak_memory(save_turn)),
+        f"session_load_{messages}msgs": dict(timed(load, repeat), peak_mib=peak_memory(load)),
+    }
+
+
+def bench_document_store(app, pages, repeat):
+    """Adding a second, overlapping edition (mostly deduplicated) and cold page reads."""
+    store = app.get_document_store()
+    data = make_pdf(pages)
+    doc = app.DocumentIngestionTool(app.PDFPipeline(cache_dir="ingest_warm")).process_files([FakeUpload("bench.pdf", data)])[0]
+    counter = {"i": 0}
+
+    def add_edition():
+        counter["i"] += 1
+        edition = [(n, text.replace("line 7:", f"line 7 (edition {counter['i']}):")) for n, text in doc["pages"]]
+        result = store.add_document(f"edition{counter['i']}.pdf", f"edition-{counter['i']}", edition)
+        store.remove_document(result["doc_id"])
+
+    content_ids = [c for _, _, _, c in store.iter_unique_pages()]
+
+    def read_pages():
+        store._cache.clear()  # cold reads: decompress from SQLite every time
+        for cid in content_ids[:50]:
+            store.page_text(cid)
+
+    return {
+        f"docstore_add_overlapping_{pages}p": dict(timed(add_edition, max(2, repeat // 5), units=pages), peak_mib=peak_memory(add_edition)),
+        "docstore_read_50_pages": dict(timed(read_pages, repeat, units=50), peak_mib=peak_memory(read_pages)),
+    }
+
+
+def started_jobs(st):
+    """Background futures the quiz has started: the hint prefetch and pending question batches."""
+    hint = st.session_state.get("hint_job")
+    return ([hint[1]] if hint else []) + list(st.session_state.prefetch["pending"])
+
+
+def llm_calls_per_question(st, jobs, calls_before, questions):
+    """LLM calls per question, counted once every background job (hints, refills) has finished."""
+    for job in jobs + started_jobs(st):
+        try: job.result()
+        except Exception: pass
+    return (stub_genai.CALLS["count"] - calls_before) / questions
+
+
+def bench_quiz_loop(app, st, questions):
+    """Take question -> grade answer -> archive, as the Next Question button does (minus rendering)."""
+    sources = ["Uploaded PDF(s)"]
+    durations, jobs = [], []
+    calls_before = stub_genai.CALLS["count"]
+    for i in range(questions):
+        start = time.perf_counter()
+        q_data, fmt, st.session_state.quiz_bank_id, _ = app.next_question(sources, "Medium", "Text-Based")
+        jobs.extend(started_jobs(st))
+        st.session_state.quiz_data = q_data
+        answer = q_data["answer"] if i % 2 == 0 else "something only the LLM grader can judge"
+        correct, feedback = app.TieredGrader().grade(q_data["question"], answer, q_data["answer"], sources)
+        app.archive_current_question(answer, feedback, correct)
+        durations.append(time.perf_counter() - start)
+    result = summarize(durations)
+    result["llm_calls_per_question"] = llm_calls_per_question(st, jobs, calls_before, questions)
+    return {"quiz_loop": result}
+
+
+def bench_question_bank(app, size, repeat):
+    """Near-duplicate check + insert and due-review lookup on a bank of `size` questions."""
+    from question_bank import QuestionBank
+    bank = QuestionBank("bench_question_bank.db")
+    rng = random.Random(3)
+    make = lambda: {"question": f"How does {' '.join(rng.choices(VOCABULARY, k=6))} affect {' '.join(rng.choices(VOCABULARY, k=3))}?",
+                    "answer": " ".join(rng.choices(VOCABULARY, k=8))}
+    for i in range(size):
+        qid, _ = bank.add(make(), "text", "Medium", ["Uploaded PDF(s)"])
+        bank.review(qid, 4 if i % 3 else 1, now=time.time() - 3600)
+    add = lambda: bank.add(make(), "text", "Medium", ["Uploaded PDF(s)"])
+    due = lambda: bank.next_due("text", "Medium", ["Uploaded PDF(s)"])
+    return {
+        f"bank_add_{size}q": dict(timed(add, repeat), peak_mib=peak_memory(add)),
+        f"bank_next_due_{size}q": dict(timed(due, repeat), peak_mib=peak_memory(due)),
+    }
+
+
+def bench_review_session(app, st, questions):
+    """Repeat-heavy quiz: every other question is skipped and, with no relearn delay, comes back from the bank."""
+    sources = ["Uploaded PDF(s)"]
+    bank = app.get_question_bank()
+    relearn, bank.relearn_seconds = bank.relearn_seconds, 0
+    durations, jobs = [], []
+    calls_before = stub_genai.CALLS["count"]
+    try:
+        for i in range(questions):
+            start = time.perf_counter()
+            q_data, fmt, st.session_state.quiz_bank_id, _ = app.next_question(sources, "Hard", "Text-Based")
+            jobs.extend(started_jobs(st))
+            st.session_state.quiz_data = q_data
+            if i % 2:
+                app.archive_current_question("Skipped", "Skipped by user", False)
+            else:
+                app.archive_current_question(q_data["answer"], "✅ Correct!", True)
+            durations.append(time.perf_counter() - start)
+    finally:
+        bank.relearn_seconds = relearn
+    result = summarize(durations)
+    result["llm_calls_per_question"] = llm_calls_per_question(st, jobs, calls_before, questions)
+    return {"quiz_review_session": result}
+
+
+# --- BASELINE ---
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, metrics in results.items():
+        base = baseline.get(name)
+        if not base: continue
+        for key in ("p50", "p95"):
+            now, before = metrics.get(key), base.get(key)
+            if now is None or before is None: continue
+            if now > before * (1 + tolerance) and now - before > NOISE_FLOOR_SECONDS:
+                regressions.append(f"{name}.{key}: {before * 1000:.1f} ms -> {now * 1000:.1f} ms (+{(now / before - 1) * 100:.0f}%)")
+    return regressions
+
+
+def print_report(results):
+    print(f"{'scenario':40} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'ops/s':>10} {'peak MiB':>9}")
+    for name, m in results.items():
+        print(f"{name:40} {m['p50'] * 1000:9.2f} {m['p95'] * 1000:9.2f} {m['p99'] * 1000:9.2f} "
+              f"{m['throughput']:10.1f} {m.get('peak_mib', 0):9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.05, help="stub Gemini latency per call (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="uniform +/- jitter on the stub latency (s)")
+    parser.add_argument("--quick", action="store_true", help="smaller inputs and fewer repetitions")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown vs baseline (0.25 = 25%%)")
+    parser.add_argument("--output", help="write the results as JSON here")
+    args = parser.parse_args()
+
+    stub_genai.install(args.latency, args.jitter)
+    logging.disable(logging.WARNING)
+    workdir = tempfile.mkdtemp(prefix="study_buddy_bench_")
+    os.chdir(workdir)  # session DB, caches and indexes land here, not in the repo
+
+    import streamlit as st
+    import study_buddy_agent as app
+    app.init_session()
+
+    pages = 60 if args.quick else 300
+    repeat = 5 if args.quick else 20
+    results = {}
+    results.update(bench_ingestion(app, pages, max(2, repeat // 5)))
+    for doc in app.DocumentIngestionTool(app.PDFPipeline(cache_dir="ingest_warm")).process_files([FakeUpload("bench.pdf", make_pdf(pages))]):
+        app.get_document_store().add_document(doc["name"], doc["sha256"], doc["pages"])
+    results.update(bench_document_store(app, pages, repeat))
+    results.update(bench_study_context(app, st, (10, 100) if args.quick else (10, 100, 1000), repeat))
+    results.update(bench_session_store(app, st, 200 if args.quick else 2000, repeat))
+    results.update(bench_quiz_loop(app, st, 6 if args.quick else 20))
+    results.update(bench_review_session(app, st, 6 if args.quick else 20))
+    results.update(bench_question_bank(app, 500 if args.quick else 5000, repeat))
+    print_report(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print("No baseline found; run with --save-baseline to create one.")
+        return 0
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.tolerance)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    print("OK: no regressions against baseline" if not regressions else f"{len(regressions)} regression(s)")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
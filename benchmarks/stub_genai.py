@@ -0,0 +1,90 @@
+"""
+Local stand-in for `google.generativeai` used by the benchmarks.
+install() registers it in sys.modules, so the app imports it instead of the real SDK.
+Responses are canned (valid JSON where the app expects JSON) and every call sleeps
+for a configurable latency to mimic a network round-trip.
+"""
+import json
+import random
+import sys
+import time
+import types
+
+LATENCY = {"seconds": 0.05, "jitter": 0.0}
+CALLS = {"count": 0, "prompt_chars": 0}
+TERMS = """sampling frame, Type I error, Type II error, statistical power, confidence interval, margin of error,
+p-value, null hypothesis, standard error, central limit theorem, stratified sample, cluster sample, nonresponse bias,
+undercoverage, placebo effect, blinding, regression slope, residual, outlier, leverage, correlation, chi-square test,
+degrees of freedom, binomial distribution, expected value, variance, median, interquartile range""".replace("\n", " ").split(", ")
+_rng = random.Random(11)  # batches vary like real generations, reproducibly
+
+
+def configure(**kwargs):
+    pass
+
+
+class _Response:
+    def __init__(self, text):
+        self.text = text
+
+
+class _Stream:
+    def __init__(self, text, chunk_chars=40):
+        self._chunks = [text[i:i + chunk_chars] for i in range(0, len(text), chunk_chars)]
+
+    def __iter__(self):
+        for i, chunk in enumerate(self._chunks):
+            if i: time.sleep(LATENCY["seconds"] / 20)  # trickle like a real stream
+            yield _Response(chunk)
+
+
+def canned_reply(prompt):
+    """Picks a plausible reply from the prompt's TASK line."""
+    task = prompt[prompt.rfind("TASK"):] if "TASK" in prompt else prompt
+    if "IS_CORRECT" in prompt:
+        return "IS_CORRECT: Yes | EXPLANATION: The answer matches the key."
+    if "Summarize the following" in prompt:
+        return "The student studied sampling distributions and hypothesis testing; gaps remain around Type II errors."
+    if "distinct questions" in task:
+        items = []
+        for i in range(int(next((w for w in task.split() if w.isdigit()), "5"))):
+            a, b = _rng.sample(TERMS, 2)
+            if "open (text) question" in task:
+                items.append({"type": "text", "question": f"Benchmark question {i}: how does {a} relate to {b}?",
+                              "answer": f"{a.capitalize()} constrains {b}"})
+            else:
+                items.append({"type": "mcq", "question": f"Benchmark MCQ {i}: which statement about {a} and {b} holds?",
+                              "options": [f"{a} implies {b}", f"{b} implies {a}", "Neither", "Both"],
+                              "answer": "Neither", "explanation": f"{a.capitalize()} and {b} are distinct ideas."})
+        return json.dumps(items)
+    if "MCQ" in task:
+        return json.dumps({"question": "Which error rejects a true null hypothesis?",
+                           "options": ["Type I error", "Type II error", "Power", "Bias"],
+                           "answer": "Type I error", "explanation": "By definition."})
+    if "Create a" in task:
+        return json.dumps({"question": "What is a sampling frame?", "answer": "The list the sample is drawn from"})
+    if "hint" in task:
+        return "Think about which list the sample is drawn from."
+    return "A sampling frame is the list from which a sample is drawn. 📘 **[Source: PDF]** " * 4
+
+
+class GenerativeModel:
+    def __init__(self, model_name, **kwargs):
+        self.model_name = model_name
+
+    def generate_content(self, prompt, generation_config=None, stream=False, **kwargs):
+        CALLS["count"] += 1
+        CALLS["prompt_chars"] += len(prompt)
+        time.sleep(max(0.0, LATENCY["seconds"] + random.uniform(-1, 1) * LATENCY["jitter"]))
+        text = canned_reply(prompt)
+        return _Stream(text) if stream else _Response(text)
+
+
+def install(latency=0.05, jitter=0.0):
+    """Registers this module as google.generativeai. Must run before the app is imported."""
+    LATENCY.update(seconds=latency, jitter=jitter)
+    module = sys.modules[__name__]
+    google = sys.modules.setdefault("google", types.ModuleType("google"))
+    google.generativeai = module
+    sys.modules["google.generativeai"] = module
+    return module
@@ -0,0 +1,54 @@
+from telemetry import estimate_tokens_from_chars
+
+
+def estimate_tokens(text):
+    return estimate_tokens_from_chars(len(text))
+
+
+class ContextPacker:
+    """
+    Packs prompt context into a token budget by priority.
+    Segments are admitted lowest priority value first; whatever does not fit is dropped
+    (and reported), and the admitted ones are emitted grouped by section in reading order.
+    """
+
+    def __init__(self, budget_tokens, sections=()):
+        self.budget = budget_tokens
+        self.sections = list(sections)  # emit order; unknown sections go last
+        self.segments = []
+
+    def add(self, section, text, priority, label="", order=0, emit=True):
+        """`emit=False` reserves budget for text the prompt carries elsewhere (e.g. the current question)."""
+        if text:
+            self.segments.append({"section": section, "text": text, "priority": priority, "label": label,
+                                  "order": order, "emit": emit, "tokens": estimate_tokens(text)})
+
+    def pack(self):
+        """Returns (context_text, report) where report lists what was included and dropped."""
+        used = 0
+        included, dropped = [], []
+        for seg in sorted(self.segments, key=lambda s: s["priority"]):
+            if used + seg["tokens"] <= self.budget:
+                used += seg["tokens"]
+                included.append(seg)
+            else:
+                dropped.append(seg)
+
+        def rank(seg):
+            idx = self.sections.index(seg["section"]) if seg["section"] in self.sections else len(self.sections)
+            return idx, seg["order"]
+
+        parts = []
+        current = None
+        for seg in sorted((s for s in included if s["emit"]), key=rank):
+            if seg["section"] != current:
+                current = seg["section"]
+                parts.append(f"\n--- {current} ---")
+            parts.append(seg["text"])
+        report = {
+            "budget": self.budget,
+            "used": used,
+            "included": [(s["section"], s["label"], s["tokens"]) for s in included],
+            "dropped": [(s["section"], s["label"], s["tokens"]) for s in dropped],
+        }
+        return "\n".join(parts).strip(), report
@@ -0,0 +1,261 @@
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (doc_id INTEGER PRIMARY KEY, name TEXT NOT NULL, sha256 TEXT NOT NULL UNIQUE,
+    added REAL NOT NULL, pages INTEGER NOT NULL, duplicate_pages INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS contents (content_id INTEGER PRIMARY KEY, sha256 TEXT NOT NULL UNIQUE,
+    chars INTEGER NOT NULL, data BLOB NOT NULL, minhash BLOB);
+CREATE TABLE IF NOT EXISTS pages (page_id INTEGER PRIMARY KEY, doc_id INTEGER NOT NULL, page_no INTEGER,
+    content_id INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS lsh (band INTEGER NOT NULL, bucket INTEGER NOT NULL, content_id INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS pages_by_doc ON pages (doc_id);
+CREATE INDEX IF NOT EXISTS pages_by_content ON pages (content_id);
+CREATE INDEX IF NOT EXISTS lsh_by_bucket ON lsh (band, bucket);
+CREATE INDEX IF NOT EXISTS lsh_by_content ON lsh (content_id);
+"""
+
+WORD = re.compile(r"[a-z0-9]+")
+HASH_VERSION = 1  # bump when MinHasher output changes: stored signatures and LSH buckets are then recomputed
+
+
+def normalize_page(text):
+    """Whitespace/case-insensitive form used for exact-duplicate hashing."""
+    return " ".join(WORD.findall(text.lower()))
+
+
+class MinHasher:
+    """
+    MinHash signatures over word shingles (character n-grams with chars=True, for short texts
+    such as questions). With `bands` x `rows` = `num_perm`, texts whose Jaccard similarity is
+    well above (1/bands)^(1/rows) share at least one LSH bucket.
+    """
+
+    def __init__(self, num_perm=64, bands=16, shingle=5, seed=7, chars=False):
+        assert num_perm % bands == 0
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle = shingle
+        self.chars = chars
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(0, 1 << 64, size=num_perm, dtype=np.uint64, endpoint=False) | np.uint64(1)  # odd multipliers
+        self._b = rng.integers(0, 1 << 64, size=num_perm, dtype=np.uint64, endpoint=False)
+
+    def signature(self, text):
+        """uint32 signature, or None when the text is too short for shingling to mean anything."""
+        words = normalize_page(text) if self.chars else WORD.findall(text.lower())
+        if len(words) < self.shingle * 2:
+            return None
+        joiner = "" if self.chars else " "
+        shingles = {joiner.join(words[i:i + self.shingle]) for i in range(len(words) - self.shingle + 1)}
+        x = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+        # Multiply-shift hashing: uint64 arithmetic wraps mod 2^64, the high 32 bits are the hash
+        hashed = (self._a[:, None] * x[None, :] + self._b[:, None]) >> np.uint64(32)
+        return hashed.min(axis=1).astype(np.uint32)
+
+    def buckets(self, sig):
+        """One (band, bucket) key per band."""
+        return [(band, zlib.crc32(sig[band * self.rows:(band + 1) * self.rows].tobytes()))
+                for band in range(self.bands)]
+
+    @staticmethod
+    def similarity(a, b):
+        return float(np.mean(a == b))
+
+
+class DocumentStore:
+    """
+    Per-user document store on SQLite: every page is a zlib-compressed record, loaded
+    lazily by id. Pages are deduplicated on write: identical text (after whitespace/case
+    normalisation) and near-duplicates (MinHash >= `near_duplicate`) point at one shared
+    content record, so overlapping uploads are stored, indexed and retrieved once.
+    Removing a document deletes only the content no other document still uses.
+    """
+
+    def __init__(self, path, near_duplicate=0.9, cache_pages=128):
+        self.path = path
+        self.near_duplicate = near_duplicate
+        self.hasher = MinHasher()
+        self._lock = threading.RLock()
+        self._cache = OrderedDict()  # content_id -> text (small LRU working set)
+        self.cache_pages = cache_pages
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(SCHEMA)
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] < HASH_VERSION:
+            self._rehash()
+
+    def _rehash(self):
+        """One-time migration: recomputes every stored signature and its LSH buckets with the current hasher."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self._conn.execute("PRAGMA user_version").fetchone()[0] >= HASH_VERSION:  # another process got here first
+                    self._conn.execute("COMMIT")
+                    return
+                self._conn.execute("DELETE FROM lsh")
+                ids = [cid for (cid,) in self._conn.execute("SELECT content_id FROM contents")]
+                for content_id in ids:
+                    (data,) = self._conn.execute("SELECT data FROM contents WHERE content_id = ?", (content_id,)).fetchone()
+                    sig = self.hasher.signature(zlib.decompress(data).decode("utf-8"))
+                    self._conn.execute("UPDATE contents SET minhash = ? WHERE content_id = ?",
+                                       (sig.tobytes() if sig is not None else None, content_id))
+                    if sig is not None:
+                        self._conn.executemany("INSERT INTO lsh (band, bucket, content_id) VALUES (?, ?, ?)",
+                                               [(band, bucket, content_id) for band, bucket in self.hasher.buckets(sig)])
+                self._conn.execute(f"PRAGMA user_version = {HASH_VERSION}")
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        if ids: logging.info(f"📚 Re-hashed {len(ids)} stored pages for near-duplicate detection")
+
+    # --- READS ---
+    def is_empty(self):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM pages LIMIT 1").fetchone() is None
+
+    def documents(self):
+        """[{doc_id, name, sha256, pages, duplicate_pages}] in upload order."""
+        with self._lock:
+            rows = self._conn.execute("SELECT doc_id, name, sha256, pages, duplicate_pages FROM documents ORDER BY doc_id").fetchall()
+        return [dict(zip(("doc_id", "name", "sha256", "pages", "duplicate_pages"), r)) for r in rows]
+
+    def file_hashes(self):
+        with self._lock:
+            return {sha for (sha,) in self._conn.execute("SELECT sha256 FROM documents")}
+
+    def total_chars(self):
+        """Characters of unique page text (what a size cap should count)."""
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(chars), 0) FROM contents").fetchone()[0]
+
+    def fingerprint(self):
+        """Changes whenever a document is added or removed (indexes built on the store key on this)."""
+        with self._lock:
+            shas = [sha for (sha,) in self._conn.execute("SELECT sha256 FROM documents ORDER BY doc_id")]
+        return hashlib.sha256(",".join(shas).encode("utf-8")).hexdigest() if shas else ""
+
+    def page_text(self, content_id):
+        with self._lock:
+            if content_id in self._cache:
+                self._cache.move_to_end(content_id)
+                return self._cache[content_id]
+            row = self._conn.execute("SELECT data FROM contents WHERE content_id = ?", (content_id,)).fetchone()
+            if row is None:
+                raise KeyError(f"Unknown page content {content_id}")
+            text = zlib.decompress(row[0]).decode("utf-8")
+            self._cache[content_id] = text
+            while len(self._cache) > self.cache_pages:
+                self._cache.popitem(last=False)
+            return text
+
+    def iter_unique_pages(self):
+        """
+        Yields (doc_name, page_no, text, content_id) once per distinct content, cited by the
+        first page that uses it. Pages are decompressed one at a time.
+        """
+        with self._lock:
+            rows = self._conn.execute("""SELECT p.content_id, d.name, p.page_no FROM pages p
+                JOIN documents d ON d.doc_id = p.doc_id ORDER BY p.page_id""").fetchall()
+        seen = set()
+        for content_id, name, page_no in rows:
+            if content_id in seen: continue
+            seen.add(content_id)
+            with self._lock:
+                row = self._conn.execute("SELECT data FROM contents WHERE content_id = ?", (content_id,)).fetchone()
+            if row is not None:
+                yield name, page_no, zlib.decompress(row[0]).decode("utf-8"), content_id
+
+    # --- WRITES ---
+    def _find_near_duplicate(self, sig):
+        candidates = set()
+        for band, bucket in self.hasher.buckets(sig):
+            candidates.update(cid for (cid,) in self._conn.execute(
+                "SELECT content_id FROM lsh WHERE band = ? AND bucket = ?", (band, bucket)))
+        best, best_sim = None, self.near_duplicate
+        for cid in candidates:
+            row = self._conn.execute("SELECT minhash FROM contents WHERE content_id = ?", (cid,)).fetchone()
+            sim = MinHasher.similarity(sig, np.frombuffer(row[0], dtype=np.uint32))
+            if sim >= best_sim:
+                best, best_sim = cid, sim
+        return best
+
+    def _content_for(self, text):
+        """Returns (content_id, is_duplicate), inserting a new compressed record only for new text."""
+        sha = hashlib.sha256(normalize_page(text).encode("utf-8")).hexdigest()
+        row = self._conn.execute("SELECT content_id FROM contents WHERE sha256 = ?", (sha,)).fetchone()
+        if row: return row[0], True
+        sig = self.hasher.signature(text)
+        if sig is not None:
+            near = self._find_near_duplicate(sig)
+            if near is not None: return near, True
+        cur = self._conn.execute("INSERT INTO contents (sha256, chars, data, minhash) VALUES (?, ?, ?, ?)",
+                                 (sha, len(text), zlib.compress(text.encode("utf-8"), 6),
+                                  sig.tobytes() if sig is not None else None))
+        content_id = cur.lastrowid
+        if sig is not None:
+            self._conn.executemany("INSERT INTO lsh (band, bucket, content_id) VALUES (?, ?, ?)",
+                                   [(band, bucket, content_id) for band, bucket in self.hasher.buckets(sig)])
+        return content_id, False
+
+    def add_document(self, name, sha256, pages):
+        """
+        Stores [(page_no, text), ...] as one document in a single transaction.
+        Returns {doc_id, pages, duplicate_pages}; a file that is already stored is not added twice.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT doc_id, pages, duplicate_pages FROM documents WHERE sha256 = ?", (sha256,)).fetchone()
+            if row: return {"doc_id": row[0], "pages": row[1], "duplicate_pages": row[2]}
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                doc_id = self._conn.execute("INSERT INTO documents (name, sha256, added, pages, duplicate_pages) VALUES (?, ?, ?, 0, 0)",
+                                            (name, sha256, time.time())).lastrowid
+                duplicates = 0
+                for page_no, text in pages:
+                    if not text.strip(): continue
+                    content_id, dup = self._content_for(text)
+                    duplicates += dup
+                    self._conn.execute("INSERT INTO pages (doc_id, page_no, content_id) VALUES (?, ?, ?)", (doc_id, page_no, content_id))
+                stored = self._conn.execute("SELECT COUNT(*) FROM pages WHERE doc_id = ?", (doc_id,)).fetchone()[0]
+                self._conn.execute("UPDATE documents SET pages = ?, duplicate_pages = ? WHERE doc_id = ?", (stored, duplicates, doc_id))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        if duplicates: logging.info(f"📚 {name}: {duplicates}/{stored} pages already stored (deduplicated)")
+        return {"doc_id": doc_id, "pages": stored, "duplicate_pages": duplicates}
+
+    def remove_document(self, doc_id):
+        """Deletes one document; content shared with other documents stays."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM pages WHERE doc_id = ?", (doc_id,))
+                self._conn.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+                orphans = [cid for (cid,) in self._conn.execute(
+                    "SELECT content_id FROM contents WHERE content_id NOT IN (SELECT content_id FROM pages)")]
+                self._conn.executemany("DELETE FROM lsh WHERE content_id = ?", [(c,) for c in orphans])
+                self._conn.executemany("DELETE FROM contents WHERE content_id = ?", [(c,) for c in orphans])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            for cid in orphans:
+                self._cache.pop(cid, None)
+        return len(orphans)
+
+    def clear(self):
+        with self._lock:
+            self._conn.executescript("BEGIN; DELETE FROM lsh; DELETE FROM pages; DELETE FROM contents; DELETE FROM documents; COMMIT;")
+            self._cache.clear()
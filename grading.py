@@ -0,0 +1,104 @@
+import difflib
+import re
+
+# A standalone number: not part of an identifier like "H0" or "x2", and a hyphen only counts
+# as a minus sign when it does not follow a number ("1939-1945" is two years, not 1939 and -1945)
+NUMBER = re.compile(r"(?<![\w.])-?(?:\d{1,3}(?:,\d{3})+|\d*\.\d+|\d+)%?(?![A-Za-z0-9_])")
+# Words plus the operators and signs that change an answer's meaning ("p < 0.05", "n-1", "-1.96")
+TOKEN = re.compile(r"!=|<=|>=|[<>=+\-*/^±%]|[a-z0-9]+")
+SYMBOLS = str.maketrans({"≠": "!=", "≤": "<=", "≥": ">=", "−": "-", "–": "-"})
+WORDS = re.compile(r"[a-z0-9]+")
+# Hyphens that are not operators: inside words ("two-tailed") and in ranges ("1939-1945")
+JOINING_HYPHEN = re.compile(r"(?<=[a-z])-(?=[a-z])|(?<=\d)-(?=\d)")
+FILLER = set("a an the is are was were of to in on for and or it its this that be by as with".split())
+NEGATIONS = set("not no never none neither nor cannot isnt arent doesnt dont wasnt werent".split())
+NON_ANSWERS = {"", "idk", "i dont know", "dont know", "no idea", "skip", "pass", "no answer"}
+
+
+def normalize(text):
+    """
+    Lowercase, drop punctuation/apostrophes and filler words, keep operators and signs:
+    'The Null-Hypothesis.' -> 'null hypothesis', 'p < 0.05' -> 'p < 0 05'.
+    """
+    text = JOINING_HYPHEN.sub(" ", str(text).lower().replace("'", "").translate(SYMBOLS))
+    return " ".join(t for t in TOKEN.findall(text) if t not in FILLER)
+
+
+def parse_numbers(text):
+    """[(value, tolerance)] for each standalone number; the tolerance is half a unit of its last written digit."""
+    values = []
+    for raw in NUMBER.findall(str(text).translate(SYMBOLS)):
+        digits = raw.rstrip("%").replace(",", "")
+        decimals = len(digits.split(".")[1]) if "." in digits else 0
+        value, tolerance = float(digits), 0.5 * 10 ** -decimals if decimals else 0.0
+        if raw.endswith("%"):
+            value, tolerance = value / 100, tolerance / 100
+        values.append((value, tolerance))
+    return values
+
+
+def without_numbers(text):
+    """The normalized words and operators around the numbers: 'H0: mu = 50' -> 'h0 mu ='."""
+    return normalize(NUMBER.sub(" ", str(text).translate(SYMBOLS)))
+
+
+def parse_grader_reply(reply):
+    """
+    Reads the verdict from GraderAgent output without trusting its exact format.
+    Returns (is_correct or None if unreadable, explanation).
+    """
+    m = re.search(r"IS[_ ]CORRECT\W*(yes|no|true|false|correct|incorrect)", reply, re.I)
+    explanation = re.split(r"EXPLANATION\W*", reply, maxsplit=1, flags=re.I)
+    explanation = explanation[1].strip() if len(explanation) > 1 else reply.strip()
+    if not m:
+        return None, explanation
+    return m.group(1).lower() in ("yes", "true", "correct"), explanation
+
+
+class LocalGrader:
+    """
+    Deterministic first grading tier. score() returns (is_correct, confidence, reason);
+    is_correct is None when the answer is ambiguous and should go to the LLM grader.
+    Only exact/normalized matches (operators and signs included), numeric matches and answers
+    with exactly the key's words are accepted locally: "Type II error" is one character away
+    from "Type I error", so every other difference goes to the LLM grader.
+    """
+
+    def __init__(self, abs_tolerance=1e-9):
+        self.abs_tolerance = abs_tolerance
+
+    def _close(self, answer, key):
+        """Integer keys must match exactly; decimal keys within their stated precision (1.96 -> +/-0.005)."""
+        (a, _), (k, tolerance) = answer, key
+        return abs(a - k) <= max(self.abs_tolerance, tolerance)
+
+    def score(self, user_answer, model_answer):
+        ans, key = normalize(user_answer), normalize(model_answer)
+        if ans in NON_ANSWERS:
+            return False, 1.0, "No answer given."
+        if ans == key:
+            return True, 1.0, "Exact match with the answer key."
+
+        # Numeric keys ("0.05", "z = 1.96", "95%"): compare values, but only when the answer says
+        # nothing beyond the number or the same words as the key ("mu > 50" is not "mu = 50")
+        key_nums, ans_nums = parse_numbers(model_answer), parse_numbers(user_answer)
+        key_rest, ans_rest = without_numbers(model_answer), without_numbers(user_answer)
+        if key_nums and ans_nums and len(WORDS.findall(key_rest)) <= 2:
+            if ans_rest and ans_rest != key_rest:
+                return None, 0.5, "Answer qualifies the number; needs semantic grading."
+            if all(any(self._close(a, k) for a in ans_nums) for k in key_nums):
+                return True, 0.95, "Numeric answer matches the key."
+            if len(key_nums) > 1:
+                return None, 0.5, "Key has several numbers; needs semantic grading."
+            if any(abs(a - k) <= a_tol for a, a_tol in ans_nums for k, _ in key_nums):
+                return None, 0.5, "Answer may be the key rounded; needs semantic grading."
+            return False, 0.9, "Numeric answer does not match the key."
+
+        # Free text: the same words in any order is a match; anything else needs the LLM
+        ratio = difflib.SequenceMatcher(None, ans, key).ratio()
+        ans_set = set(ans.split())
+        if ans_set == set(key.split()):
+            return True, 1.0, "Same key terms as the answer key."
+        if (NEGATIONS & ans_set) - set(key.split()):
+            return None, ratio, "Answer contains a negation; needs semantic grading."
+        return None, ratio, "Differs from the key; needs semantic grading."
@@ -0,0 +1,270 @@
+import hashlib
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import google.generativeai as genai
+from google.api_core import exceptions as api_exceptions
+
+DEFAULT_MODEL = "gemini-2.5-flash"
+CACHE_DB = "llm_cache.db"
+# Quota (429), server-side (500/503/504) and network errors are retried; bad requests, auth and safety blocks are not
+TRANSIENT_ERRORS = (api_exceptions.TooManyRequests, api_exceptions.ResourceExhausted, api_exceptions.InternalServerError,
+                    api_exceptions.ServiceUnavailable, api_exceptions.GatewayTimeout, api_exceptions.DeadlineExceeded,
+                    ConnectionError, TimeoutError)
+
+
+class CallDeadlineExceeded(Exception):
+    """The call's deadline passed while it was still waiting for the rate limiter or a model slot."""
+
+
+class ResponseCache:
+    """
+    Content-addressed LLM response cache.
+    A bounded in-memory LRU sits in front of a SQLite table on disk; disk entries
+    expire after `ttl_seconds` and the least recently used ones are evicted once
+    the table grows past `max_disk_bytes`.
+    """
+
+    def __init__(self, path=CACHE_DB, memory_items=256, ttl_seconds=7 * 24 * 3600, max_disk_bytes=50 * 1024 * 1024):
+        self.memory_items = memory_items
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY, created REAL NOT NULL, last_used REAL NOT NULL,
+            size INTEGER NOT NULL, text TEXT NOT NULL)""")
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def make_key(model_name, prompt, generation_config=None):
+        payload = json.dumps([model_name, prompt, generation_config or {}], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _remember(self, key, text):
+        self._memory[key] = text
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return self._memory[key]
+            now = time.time()
+            row = self._conn.execute("SELECT text, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row and now - row[1] <= self.ttl_seconds:
+                self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+                self._remember(key, row[0])
+                self.stats["disk_hits"] += 1
+                return row[0]
+            if row:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, key, text):
+        with self._lock:
+            now = time.time()
+            self._remember(key, text)
+            size = len(text.encode("utf-8"))
+            self._conn.execute("INSERT OR REPLACE INTO responses (key, created, last_used, size, text) VALUES (?, ?, ?, ?, ?)",
+                               (key, now, now, size, text))
+            self._evict(now)
+
+    def _evict(self, now):
+        cur = self._conn
+        cur.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,))
+        total = cur.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_disk_bytes: return
+        target = self.max_disk_bytes * 0.8  # evict down to 80% so we don't evict on every put
+        for key, size in cur.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall():
+            if total <= target: break
+            cur.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._memory.pop(key, None)
+            total -= size
+            self.stats["evictions"] += 1
+
+    def hit_rate(self):
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+
+class RateLimiter:
+    """Token bucket shared by all threads: `rate` calls per second on average, bursts of up to `burst`."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        """Takes one token, waiting for it if needed. Returns False if that would take longer than `timeout`."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class ModelGateway:
+    """
+    Single entry point for every Gemini call. Reuses model objects and,
+    when the caller opts in, serves identical (model, prompt, config) requests from the cache.
+    Calls to the API go through the optional rate limiter and a concurrency cap, transient
+    errors are retried with jittered exponential backoff, and each call has a deadline
+    (`timeout` seconds, retries and waiting included).
+    Every call (cache hits included) is recorded as a span on the optional Telemetry.
+    """
+
+    def __init__(self, cache=None, model_name=DEFAULT_MODEL, telemetry=None, rate_limiter=None, max_concurrent=4,
+                 max_retries=3, backoff_base=0.5, backoff_max=8.0, timeout=60.0):
+        self.cache = cache
+        self.model_name = model_name
+        self.telemetry = telemetry
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._models = {}
+
+    def model(self, model_name=None):
+        name = model_name or self.model_name
+        if name not in self._models:
+            self._models[name] = genai.GenerativeModel(name)
+        return self._models[name]
+
+    def _record(self, agent, start, prompt, text, error=None, cache_hit=False, ttft=None, retries=0):
+        if self.telemetry is None: return
+        self.telemetry.record(agent, time.time() - start, prompt_chars=len(prompt), response_chars=len(text or ""),
+                              ok=error is None, error=error, cache_hit=cache_hit, ttft=ttft, retries=retries)
+
+    def _acquire(self, deadline):
+        """Waits for a rate-limit token and a concurrency slot; returns the seconds left for the request."""
+        if self.rate_limiter is not None and not self.rate_limiter.acquire(timeout=deadline - time.monotonic()):
+            raise CallDeadlineExceeded("Deadline exceeded waiting for the rate limiter")
+        if not self._slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            raise CallDeadlineExceeded("Deadline exceeded waiting for a free model slot")
+        return max(0.1, deadline - time.monotonic())
+
+    def _backoff(self, attempt, deadline, error, agent):
+        """Sleeps before retry `attempt` (1-based), or re-raises `error` when out of retries or time."""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))  # "full jitter"
+        if attempt > self.max_retries or time.monotonic() + delay >= deadline:
+            raise error
+        logging.warning(f"⏳ {agent or 'LLM'} call failed ({type(error).__name__}: {error}); retry {attempt} in {delay:.1f}s")
+        time.sleep(delay)
+
+    def _cached(self, name, prompt, generation_config, use_cache):
+        """Returns (cache key or None, cached text or None)."""
+        if not use_cache or self.cache is None:
+            return None, None
+        key = self.cache.make_key(name, prompt, generation_config)
+        return key, self.cache.get(key)
+
+    def generate(self, prompt, agent="", use_cache=True, generation_config=None, model_name=None, timeout=None):
+        """Returns the response text for the prompt."""
+        start = time.time()
+        deadline = time.monotonic() + (timeout or self.timeout)
+        name = model_name or self.model_name
+        key, cached = self._cached(name, prompt, generation_config, use_cache)
+        if cached is not None:
+            logging.info(f"💾 CACHE HIT: {agent or name}")
+            self._record(agent, start, prompt, cached, cache_hit=True)
+            return cached
+        attempt = 0
+        while True:
+            try:
+                remaining = self._acquire(deadline)
+                try:
+                    text = self.model(name).generate_content(prompt, generation_config=generation_config,
+                                                             request_options={"timeout": remaining}).text
+                finally:
+                    self._slots.release()
+                break
+            except TRANSIENT_ERRORS as e:
+                attempt += 1
+                try:
+                    self._backoff(attempt, deadline, e, agent)
+                except Exception:
+                    self._record(agent, start, prompt, "", error=f"{type(e).__name__}: {e}", retries=attempt - 1)
+                    raise
+            except Exception as e:
+                self._record(agent, start, prompt, "", error=f"{type(e).__name__}: {e}", retries=attempt)
+                raise
+        self._record(agent, start, prompt, text, retries=attempt)
+        if key is not None and text:
+            self.cache.put(key, text)
+        return text
+
+    def generate_stream(self, prompt, agent="", use_cache=True, generation_config=None, model_name=None, timeout=None):
+        """
+        Yields response text chunks as they arrive; the full text is cached once the stream completes.
+        Transient errors are retried only until the first chunk has been yielded.
+        """
+        start = time.time()
+        deadline = time.monotonic() + (timeout or self.timeout)
+        name = model_name or self.model_name
+        key, cached = self._cached(name, prompt, generation_config, use_cache)
+        if cached is not None:
+            logging.info(f"💾 CACHE HIT: {agent or name}")
+            self._record(agent, start, prompt, cached, cache_hit=True, ttft=time.time() - start)
+            yield cached
+            return
+        parts = []
+        ttft = None
+        attempt = 0
+        while True:
+            try:
+                remaining = self._acquire(deadline)
+                try:
+                    for chunk in self.model(name).generate_content(prompt, generation_config=generation_config, stream=True,
+                                                                   request_options={"timeout": remaining}):
+                        try:
+                            text = chunk.text
+                        except ValueError:
+                            continue  # chunk without text parts (e.g. finish/safety metadata)
+                        if text:
+                            if ttft is None: ttft = time.time() - start
+                            parts.append(text)
+                            yield text
+                finally:
+                    self._slots.release()
+                break
+            except TRANSIENT_ERRORS as e:
+                attempt += 1
+                try:
+                    if parts: raise e  # the caller already has partial output; a retry would repeat it
+                    self._backoff(attempt, deadline, e, agent)
+                except Exception:
+                    self._record(agent, start, prompt, "".join(parts), error=f"{type(e).__name__}: {e}", ttft=ttft,
+                                 retries=attempt - 1)
+                    raise
+            except Exception as e:
+                self._record(agent, start, prompt, "".join(parts), error=f"{type(e).__name__}: {e}", ttft=ttft, retries=attempt)
+                raise
+        self._record(agent, start, prompt, "".join(parts), ttft=ttft, retries=attempt)
+        if key is not None and parts:
+            self.cache.put(key, "".join(parts))
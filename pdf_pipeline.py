@@ -0,0 +1,143 @@
+import hashlib
+import io
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import PyPDF2
+
+INGEST_CACHE_DIR = ".ingest_cache"  # file SHA-256 -> extracted pages
+PAGES_PER_TASK = 16
+MIN_PAGES_FOR_POOL = 24  # below this the pool start-up costs more than it saves
+
+
+def file_sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _extract_page_range(data, start, end):
+    """
+    Pool worker: extracts pages [start, end) from the PDF bytes.
+    Returns (page_no, text, error, seconds) per page; a bad page never sinks the batch.
+    """
+    reader = PyPDF2.PdfReader(io.BytesIO(data))
+    results = []
+    for i in range(start, end):
+        t0 = time.time()
+        try:
+            text = reader.pages[i].extract_text() or ""
+            results.append((i + 1, text, None, time.time() - t0))
+        except Exception as e:
+            results.append((i + 1, "", f"{type(e).__name__}: {e}", time.time() - t0))
+    return results
+
+
+class FileReport:
+    """Per-file ingestion outcome shown in the sidebar."""
+
+    def __init__(self, name, sha256):
+        self.name = name
+        self.sha256 = sha256
+        self.pages = 0
+        self.cached = False
+        self.errors = []  # [(page_no or None, message)]
+        self.seconds = 0.0
+        self.page_seconds = {}
+
+    def summary(self):
+        src = "cache" if self.cached else f"{self.seconds:.2f}s"
+        line = f"{self.name}: {self.pages} pages ({src})"
+        if self.errors: line += f", {len(self.errors)} error(s)"
+        return line
+
+
+class PDFPipeline:
+    """Multi-process, content-hash cached PDF text extraction."""
+
+    def __init__(self, cache_dir=INGEST_CACHE_DIR, max_workers=None):
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers or max(1, (os.cpu_count() or 2) - 1)
+
+    def _cache_path(self, sha):
+        return os.path.join(self.cache_dir, f"{sha}.json")
+
+    def _load_cached(self, sha):
+        path = self._cache_path(sha)
+        if not os.path.exists(path): return None
+        try:
+            with open(path, "r") as f:
+                return [tuple(p) for p in json.load(f)["pages"]]
+        except Exception as e:
+            logging.error(f"Ignoring corrupt ingest cache {path}: {e}")
+            return None
+
+    def _store_cached(self, sha, name, pages):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._cache_path(sha)
+        with open(path + ".tmp", "w") as f:
+            json.dump({"name": name, "pages": pages}, f)
+        os.replace(path + ".tmp", path)
+
+    def iter_pages(self, name, data, report):
+        """
+        Streams (page_no, text) as pages finish (completion order, not page order).
+        Fills `report` with page count, per-page errors and timings.
+        """
+        t0 = time.time()
+        cached = self._load_cached(report.sha256)
+        if cached is not None:
+            report.cached = True
+            report.pages = len(cached)
+            yield from cached
+            return
+        try:
+            n_pages = len(PyPDF2.PdfReader(io.BytesIO(data)).pages)
+        except Exception as e:
+            report.errors.append((None, f"{type(e).__name__}: {e}"))
+            return
+        report.pages = n_pages
+        ranges = [(s, min(s + PAGES_PER_TASK, n_pages)) for s in range(0, n_pages, PAGES_PER_TASK)]
+        pages = []
+
+        def collect(batch):
+            for page_no, text, error, seconds in batch:
+                report.page_seconds[page_no] = seconds
+                if error: report.errors.append((page_no, error))
+                if text:
+                    pages.append((page_no, text))
+                    yield page_no, text
+
+        if n_pages < MIN_PAGES_FOR_POOL or self.max_workers == 1:
+            for start, end in ranges:
+                yield from collect(_extract_page_range(data, start, end))
+        else:
+            with ProcessPoolExecutor(max_workers=min(self.max_workers, len(ranges))) as pool:
+                futures = {pool.submit(_extract_page_range, data, s, e): (s, e) for s, e in ranges}
+                for fut in as_completed(futures):
+                    try:
+                        batch = fut.result()
+                    except Exception as e:
+                        s, e_ = futures[fut]
+                        report.errors.append((None, f"pages {s + 1}-{e_}: {type(e).__name__}: {e}"))
+                        continue
+                    yield from collect(batch)
+        report.seconds = time.time() - t0
+        pages.sort()
+        # Only cache clean extractions, so a transient failure is retried next upload
+        if pages and not report.errors:
+            try:
+                self._store_cached(report.sha256, name, pages)
+            except Exception as e:
+                logging.error(f"Failed to write ingest cache: {e}")
+
+    def extract(self, name, data, on_page=None):
+        """Returns (pages sorted by page_no, FileReport). `on_page(page_no, total)` is called per page."""
+        report = FileReport(name, file_sha256(data))
+        pages = []
+        for page_no, text in self.iter_pages(name, data, report):
+            pages.append((page_no, text))
+            if on_page: on_page(page_no, report.pages)
+        pages.sort()
+        return pages, report
@@ -0,0 +1,165 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from doc_store import MinHasher, normalize_page
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS questions (qid INTEGER PRIMARY KEY, sha256 TEXT NOT NULL UNIQUE, format TEXT NOT NULL,
+    difficulty TEXT NOT NULL, sources TEXT NOT NULL, data TEXT NOT NULL, minhash BLOB, added REAL NOT NULL,
+    easiness REAL NOT NULL DEFAULT 2.5, interval REAL NOT NULL DEFAULT 0,
+    repetitions INTEGER NOT NULL DEFAULT 0, lapses INTEGER NOT NULL DEFAULT 0, due REAL, reviewed REAL);
+CREATE TABLE IF NOT EXISTS lsh (band INTEGER NOT NULL, bucket INTEGER NOT NULL, qid INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS questions_due ON questions (format, difficulty, sources, due);
+CREATE INDEX IF NOT EXISTS lsh_by_bucket ON lsh (band, bucket);
+"""
+
+COLUMNS = ("qid", "format", "difficulty", "sources", "data", "easiness", "interval", "repetitions", "lapses", "due")
+DAY = 24 * 60 * 60
+
+
+def review_quality(correct, skipped=False):
+    """SM-2 response quality (0-5) for a quiz outcome: skipped 0, wrong 1, right 4."""
+    if skipped: return 0
+    return 4 if correct else 1
+
+
+def sources_key(sources):
+    return "|".join(sorted(sources))
+
+
+class QuestionBank:
+    """
+    Per-user bank of every question the student has been asked, on SQLite.
+
+    Near-duplicates (MinHash over character 5-grams of question + answer >= `near_duplicate`)
+    are detected on add, so a regenerated question reuses the existing entry instead of
+    being asked again as if it were new. Answers are scheduled SM-2 style: a wrong answer
+    comes back after `relearn_seconds`, a right one after 1 day, 6 days, then interval x
+    easiness. The (format, difficulty, sources, due) index is the review priority queue:
+    next_due() returns the most overdue question for the current quiz settings.
+    """
+
+    def __init__(self, path, near_duplicate=0.8, relearn_seconds=10 * 60, first_interval=DAY, second_interval=6 * DAY):
+        self.path = path
+        self.near_duplicate = near_duplicate
+        self.relearn_seconds = relearn_seconds
+        self.first_interval = first_interval
+        self.second_interval = second_interval
+        self.hasher = MinHasher(num_perm=128, bands=32, shingle=5, chars=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(SCHEMA)
+
+    @staticmethod
+    def _text(q_data):
+        return f"{q_data.get('question', '')} {q_data.get('answer', '')}"
+
+    def _sha(self, q_data, fmt):
+        """Exact-duplicate key: format + whitespace/case-normalised question and answer."""
+        return hashlib.sha256(f"{fmt}:{normalize_page(self._text(q_data))}".encode("utf-8")).hexdigest()
+
+    # --- READS ---
+    def stats(self, now=None):
+        """{questions, reviewed, due} for the whole bank."""
+        now = time.time() if now is None else now
+        with self._lock:
+            total, reviewed, due = self._conn.execute(
+                "SELECT COUNT(*), COUNT(due), COALESCE(SUM(due <= ?), 0) FROM questions", (now,)).fetchone()
+        return {"questions": total, "reviewed": reviewed, "due": due}
+
+    def get(self, qid):
+        with self._lock:
+            row = self._conn.execute(f"SELECT {', '.join(COLUMNS)} FROM questions WHERE qid = ?", (qid,)).fetchone()
+        if row is None: return None
+        item = dict(zip(COLUMNS, row))
+        item["data"] = json.loads(item["data"])
+        return item
+
+    def next_due(self, fmt, difficulty, sources, now=None, exclude=()):
+        """The most overdue reviewed question for these settings, or None."""
+        now = time.time() if now is None else now
+        with self._lock:
+            rows = self._conn.execute("""SELECT qid FROM questions WHERE format = ? AND difficulty = ? AND sources = ?
+                AND due <= ? ORDER BY due LIMIT ?""",
+                (fmt, difficulty, sources_key(sources), now, len(exclude) + 1)).fetchall()
+        for (qid,) in rows:
+            if qid not in exclude:
+                return self.get(qid)
+        return None
+
+    def find_duplicate(self, q_data, fmt):
+        """qid of a stored question in this format that matches q_data exactly or nearly, else None."""
+        with self._lock:
+            row = self._conn.execute("SELECT qid FROM questions WHERE sha256 = ?", (self._sha(q_data, fmt),)).fetchone()
+            if row: return row[0]
+            sig = self.hasher.signature(self._text(q_data))
+            return self._find_near_duplicate(sig, fmt) if sig is not None else None
+
+    def _find_near_duplicate(self, sig, fmt):
+        candidates = set()
+        for band, bucket in self.hasher.buckets(sig):
+            candidates.update(qid for (qid,) in self._conn.execute(
+                "SELECT qid FROM lsh WHERE band = ? AND bucket = ?", (band, bucket)))
+        best, best_sim = None, self.near_duplicate
+        for qid in candidates:
+            row = self._conn.execute("SELECT minhash FROM questions WHERE qid = ? AND format = ?", (qid, fmt)).fetchone()
+            if row is None: continue
+            sim = MinHasher.similarity(sig, np.frombuffer(row[0], dtype=np.uint32))
+            if sim >= best_sim:
+                best, best_sim = qid, sim
+        return best
+
+    # --- WRITES ---
+    def add(self, q_data, fmt, difficulty, sources):
+        """Stores a question about to be asked. Returns (qid, is_new); a near-duplicate returns the existing qid."""
+        with self._lock:
+            existing = self.find_duplicate(q_data, fmt)
+            if existing is not None: return existing, False
+            sig = self.hasher.signature(self._text(q_data))
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                qid = self._conn.execute("""INSERT INTO questions (sha256, format, difficulty, sources, data, minhash, added)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)""", (self._sha(q_data, fmt), fmt, difficulty, sources_key(sources),
+                    json.dumps(q_data), sig.tobytes() if sig is not None else None, time.time())).lastrowid
+                if sig is not None:
+                    self._conn.executemany("INSERT INTO lsh (band, bucket, qid) VALUES (?, ?, ?)",
+                                           [(band, bucket, qid) for band, bucket in self.hasher.buckets(sig)])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return qid, True
+
+    def review(self, qid, quality, now=None):
+        """Records one answer (SM-2 quality 0-5) and schedules the next review. Returns the new due time."""
+        now = time.time() if now is None else now
+        with self._lock:
+            row = self._conn.execute("SELECT easiness, interval, repetitions, lapses FROM questions WHERE qid = ?", (qid,)).fetchone()
+            if row is None:
+                logging.warning(f"Review for unknown question {qid} ignored")
+                return None
+            easiness, interval, repetitions, lapses = row
+            easiness = max(1.3, easiness + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+            if quality < 3:
+                repetitions, interval, lapses = 0, self.relearn_seconds, lapses + 1
+            else:
+                repetitions += 1
+                if repetitions == 1: interval = self.first_interval
+                elif repetitions == 2: interval = self.second_interval
+                else: interval = interval * easiness
+            due = now + interval
+            self._conn.execute("""UPDATE questions SET easiness = ?, interval = ?, repetitions = ?, lapses = ?, due = ?,
+                reviewed = ? WHERE qid = ?""", (easiness, interval, repetitions, lapses, due, now, qid))
+        return due
+
+    def clear(self):
+        with self._lock:
+            self._conn.executescript("BEGIN; DELETE FROM lsh; DELETE FROM questions; COMMIT;")
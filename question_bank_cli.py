@@ -0,0 +1,187 @@
+"""
+Headless question-bank builder: turns a directory of PDFs into a JSONL file of validated questions.
+
+    python question_bank_cli.py course_pdfs/ -o course_questions.jsonl --workers 4 --per-chunk 5
+
+PDFs are extracted with the same cached pipeline as the app, split into passage windows, and
+each window becomes one batched ProfessorAgent call on a bounded worker pool. Questions are
+appended to the output as they arrive; finished windows are recorded, so re-running the same
+command after an interruption resumes where it stopped. Streamlit is never imported.
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import google.generativeai as genai
+
+from agents import DocumentIngestionTool, ProfessorAgent
+from llm_gateway import ModelGateway, RateLimiter
+from pdf_pipeline import PDFPipeline
+from rag_index import BM25Index, Chunker
+
+Q_TYPES = {"text": "Text-Based", "mcq": "Multiple Choice (MCQ)"}
+DIFFICULTIES = {d.lower(): d for d in ("Easy", "Medium", "Hard")}  # the app's choices, matched case-insensitively
+FORMAT_NAMES = {"text": "text", "json": "mcq"}
+
+
+class LocalFile(io.BytesIO):
+    """A PDF on disk in the shape DocumentIngestionTool expects (name + getvalue)."""
+
+    def __init__(self, path, name):
+        with open(path, "rb") as f:
+            super().__init__(f.read())
+        self.name = name
+
+
+def find_pdfs(root):
+    for dirpath, _, files in os.walk(root):
+        for name in sorted(files):
+            if name.lower().endswith(".pdf"):
+                yield os.path.join(dirpath, name)
+
+
+def windows(document, max_chars):
+    """
+    Splits one extracted document into (key, context, pages) passage windows of about max_chars.
+    The key names the file, the window size and the window's position, so a run with a different
+    --chunk-chars never mistakes its windows for an earlier run's.
+    """
+    chunks = Chunker().chunk_pages((document["name"], page_no, text, None) for page_no, text in document["pages"])
+    batch, size, index = [], 0, 0
+    for chunk in chunks + [None]:
+        if batch and (chunk is None or size + len(chunk["text"]) > max_chars):
+            pages = [c["page"] for c in batch if c["page"]]
+            yield (f"{document['sha256'][:16]}:{max_chars}:{index}", BM25Index.format_passages([(c, 0.0) for c in batch]),
+                   [min(pages), max(pages)] if pages else None)
+            batch, size, index = [], 0, index + 1
+        if chunk is not None:
+            batch.append(chunk)
+            size += len(chunk["text"])
+
+
+def load_progress(out_path, progress_path):
+    """Window keys already finished by an earlier run (from the output itself and the progress log)."""
+    done = set()
+    for path, field in ((out_path, "window"), (progress_path, None)):
+        if not os.path.exists(path): continue
+        with open(path, "r") as f:
+            for line in f:
+                line = line.strip()
+                if not line: continue
+                if field is None:
+                    done.add(line)
+                    continue
+                try:
+                    done.add(json.loads(line)[field])
+                except (ValueError, KeyError):
+                    logging.warning(f"Skipping unreadable line in {path}")  # e.g. cut off by a crash mid-write
+    return done
+
+
+def generate_window(prof, context, specs):
+    return prof.generate_questions(context, specs)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf_dir", help="directory searched recursively for *.pdf")
+    parser.add_argument("-o", "--output", default="question_bank.jsonl")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent Gemini calls")
+    parser.add_argument("--rpm", type=float, default=120, help="request rate limit per minute")
+    parser.add_argument("--per-chunk", type=int, default=5, help="questions requested per passage window")
+    parser.add_argument("--chunk-chars", type=int, default=6000, help="passage window size in characters")
+    parser.add_argument("--difficulty", default="Easy,Medium,Hard", help="comma-separated subset of Easy,Medium,Hard, cycled within a window")
+    parser.add_argument("--types", default="text,mcq", help="comma-separated subset of: " + ",".join(Q_TYPES))
+    parser.add_argument("--timeout", type=float, default=90, help="deadline per Gemini call, retries included (s)")
+    parser.add_argument("--api-key", default=os.environ.get("GEMINI_API_KEY"), help="defaults to $GEMINI_API_KEY")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    if not args.api_key:
+        parser.error("no API key: pass --api-key or set GEMINI_API_KEY")
+    genai.configure(api_key=args.api_key)
+    difficulties = [d.strip().lower() for d in args.difficulty.split(",") if d.strip()]
+    types = [t.strip() for t in args.types.split(",") if t.strip()]
+    if not difficulties or any(d not in DIFFICULTIES for d in difficulties):
+        parser.error(f"--difficulty must be a comma-separated subset of {', '.join(DIFFICULTIES.values())}")
+    if not types or any(t not in Q_TYPES for t in types):
+        parser.error(f"--types must be a comma-separated subset of {', '.join(Q_TYPES)}")
+    difficulties = [DIFFICULTIES[d] for d in difficulties]
+    specs = [(difficulties[i % len(difficulties)], Q_TYPES[types[i % len(types)]]) for i in range(args.per_chunk)]
+
+    gateway = ModelGateway(rate_limiter=RateLimiter(args.rpm / 60, burst=args.workers), max_concurrent=args.workers,
+                           timeout=args.timeout)
+    prof = ProfessorAgent(gateway)
+    prof.TIMEOUT_SECONDS = args.timeout
+    ingestor = DocumentIngestionTool(PDFPipeline())
+    progress_path = args.output + ".progress"
+    done = load_progress(args.output, progress_path)
+    if done: logging.info(f"Resuming: {len(done)} windows already done")
+
+    start = time.time()
+    stats = {"questions": 0, "windows": 0, "failed": 0, "skipped": 0}
+
+    def report():
+        minutes = max(time.time() - start, 1e-6) / 60
+        logging.info(f"{stats['windows']} windows, {stats['questions']} questions, {stats['failed']} failed "
+                     f"({stats['questions'] / minutes:.1f} questions/min)")
+
+    with open(args.output, "a") as out, open(progress_path, "a") as progress, \
+            ThreadPoolExecutor(max_workers=args.workers) as pool:
+        in_flight = {}
+
+        def collect(finished):
+            for future in finished:
+                key, name, pages = in_flight.pop(future)
+                try:
+                    questions = future.result()
+                except Exception as e:
+                    stats["failed"] += 1  # not marked done, so the next run retries it
+                    logging.error(f"{name} {key}: {type(e).__name__}: {e}")
+                    continue
+                if not questions:
+                    stats["failed"] += 1  # unparseable reply: retried next run, like an exception
+                    logging.error(f"{name} {key}: no usable questions in the reply")
+                    continue
+                for i, (q, fmt) in enumerate(questions):
+                    record = dict(q, id=f"{key}:{i}", window=key, source=name, pages=pages, format=FORMAT_NAMES[fmt])
+                    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                progress.write(key + "\n")
+                progress.flush()
+                stats["windows"] += 1
+                stats["questions"] += len(questions)
+                if stats["windows"] % 10 == 0: report()
+
+        try:
+            for path in find_pdfs(args.pdf_dir):
+                name = os.path.relpath(path, args.pdf_dir)
+                for document in ingestor.process_files([LocalFile(path, name)]):
+                    for key, context, pages in windows(document, args.chunk_chars):
+                        if key in done:
+                            stats["skipped"] += 1
+                            continue
+                        while len(in_flight) >= args.workers * 2:  # bounded queue: don't hold every window in memory
+                            collect(wait(in_flight, return_when=FIRST_COMPLETED).done)
+                        in_flight[pool.submit(generate_window, prof, context, specs)] = (key, name, pages)
+            while in_flight:
+                collect(wait(in_flight, return_when=FIRST_COMPLETED).done)
+        except KeyboardInterrupt:
+            logging.warning("Interrupted: finished windows are saved; re-run the same command to resume")
+            for future in in_flight: future.cancel()
+            pool.shutdown(wait=True, cancel_futures=True)
+            collect([f for f in in_flight if f.done() and not f.cancelled()])
+            report()
+            return 130
+    report()
+    logging.info(f"Wrote {stats['questions']} questions to {args.output} ({stats['skipped']} windows skipped as already done)")
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,180 @@
+import json
+import logging
+import math
+import os
+import random
+import re
+from collections import Counter
+
+# --- CORPUS MARKERS (written by DocumentIngestionTool) ---
+DOC_MARKER = re.compile(r"^--- START OF DOCUMENT: (.+?) ---$", re.M)
+PAGE_MARKER = re.compile(r"^--- PAGE (\d+) ---$", re.M)
+
+# Lines that look like section titles in textbook PDFs ("Chapter 11. ...", "12.3 Errors", "SUMMARY")
+HEADING = re.compile(r"^((?i:chapter|section)\s+\d+|\d+(\.\d+)+\s+[A-Z]|[A-Z][A-Z ,:&\-]{5,60}$)")
+
+TOKEN = re.compile(r"[a-z0-9]+")
+STOPWORDS = set("""
+a an and are as at be but by for from has have in is it its of on or that the this to was were
+will with what which who why how when where do does did can you your i me my we our they their
+""".split())
+
+
+def tokenize(text):
+    """Lowercase word tokens with stopwords removed."""
+    return [t for t in TOKEN.findall(text.lower()) if t not in STOPWORDS]
+
+
+class Chunker:
+    """Splits the ingested corpus into page- and section-aware passages."""
+
+    def __init__(self, max_chars=1200):
+        self.max_chars = max_chars
+
+    def split_documents(self, corpus):
+        """Yields (doc_name, text) using the START OF DOCUMENT markers."""
+        matches = list(DOC_MARKER.finditer(corpus))
+        if not matches:
+            if corpus.strip(): yield "Document", corpus
+            return
+        for i, m in enumerate(matches):
+            end = matches[i + 1].start() if i + 1 < len(matches) else len(corpus)
+            yield m.group(1), corpus[m.end():end]
+
+    def split_pages(self, text):
+        """Yields (page_no, text). Legacy corpora without page markers yield a single page None."""
+        matches = list(PAGE_MARKER.finditer(text))
+        if not matches:
+            yield None, text
+            return
+        for i, m in enumerate(matches):
+            end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+            yield int(m.group(1)), text[m.end():end]
+
+    def chunk_pages(self, pages):
+        """
+        Chunks (doc_name, page_no, text, content_id) tuples in reading order. Passages never cross
+        a page, so each chunk also records `content` and its ordinal `part` within the page:
+        enough to re-derive its text from that page alone (see DocumentStore).
+        """
+        chunks = []
+        current_doc = None
+        section = ""
+        for doc_name, page_no, page_text, content_id in pages:
+            if doc_name != current_doc:
+                current_doc, section = doc_name, ""
+            buf = []
+            size = 0
+            part = 0
+
+            def flush():
+                nonlocal part
+                body = " ".join(buf).strip()
+                if body:
+                    chunks.append({"id": len(chunks), "doc": doc_name, "page": page_no, "section": section,
+                                   "content": content_id, "part": part, "text": body})
+                    part += 1
+
+            for line in page_text.splitlines():
+                line = line.strip()
+                if not line: continue
+                if len(line) < 80 and HEADING.match(line):
+                    # New section: close the current passage so it never straddles two topics
+                    flush()
+                    buf, size = [], 0
+                    section = line
+                buf.append(line)
+                size += len(line) + 1
+                if size >= self.max_chars:
+                    flush()
+                    buf, size = [], 0
+            flush()
+        return chunks
+
+
+class BM25Index:
+    """Inverted index over corpus chunks, scored with Okapi BM25."""
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.chunks = []
+        self.postings = {}  # term -> [[chunk_id, tf], ...]
+        self.doc_len = []
+        self.avgdl = 0.0
+        self.fingerprint = None
+
+    def build(self, chunks, fingerprint=None):
+        self.chunks = chunks
+        self.postings = {}
+        self.doc_len = []
+        for chunk in chunks:
+            terms = Counter(tokenize(chunk["text"] + " " + chunk.get("section", "")))
+            self.doc_len.append(sum(terms.values()))
+            for term, tf in terms.items():
+                self.postings.setdefault(term, []).append([chunk["id"], tf])
+        self.avgdl = (sum(self.doc_len) / len(self.doc_len)) if self.doc_len else 0.0
+        self.fingerprint = fingerprint
+        logging.info(f"🔎 Indexed {len(chunks)} chunks / {len(self.postings)} terms")
+        return self
+
+    def search(self, query, top_k=6):
+        """Returns the top_k (chunk, score) pairs for the query, best first."""
+        n = len(self.chunks)
+        if not n: return []
+        scores = {}
+        for term in set(tokenize(query)):
+            plist = self.postings.get(term)
+            if not plist: continue
+            idf = math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+            for cid, tf in plist:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_len[cid] / (self.avgdl or 1))
+                scores[cid] = scores.get(cid, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        best = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:top_k]
+        return [(self.chunks[cid], score) for cid, score in best]
+
+    def sample(self, k=6, seed=None):
+        """Random spread of passages, used when there is no query (e.g. quiz generation)."""
+        if not self.chunks: return []
+        rng = random.Random(seed)
+        picked = rng.sample(self.chunks, min(k, len(self.chunks)))
+        return [(chunk, 0.0) for chunk in sorted(picked, key=lambda c: c["id"])]
+
+    @staticmethod
+    def format_passages(results):
+        parts = []
+        for chunk, _ in results:
+            where = chunk["doc"]
+            if chunk.get("page"): where += f", p. {chunk['page']}"
+            if chunk.get("section"): where += f" — {chunk['section']}"
+            parts.append(f"[Passage from {where}]\n{chunk['text']}")
+        return "\n\n".join(parts)
+
+    def save(self, path):
+        data = {"k1": self.k1, "b": self.b, "fingerprint": self.fingerprint, "chunks": self.chunks,
+                "postings": self.postings, "doc_len": self.doc_len, "avgdl": self.avgdl}
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r") as f:
+            data = json.load(f)
+        index = cls(data.get("k1", 1.5), data.get("b", 0.75))
+        index.chunks = data["chunks"]
+        index.postings = data["postings"]
+        index.doc_len = data["doc_len"]
+        index.avgdl = data["avgdl"]
+        index.fingerprint = data.get("fingerprint")
+        return index
+
+
+def fuse_rankings(rankings, k=60):
+    """Reciprocal rank fusion of several ranked id lists (e.g. BM25 + dense)."""
+    scores = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank + 1)
+    return [item_id for item_id, _ in sorted(scores.items(), key=lambda kv: kv[1], reverse=True)]
@@ -0,0 +1,258 @@
+import atexit
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS chat (seq INTEGER PRIMARY KEY, role TEXT NOT NULL, content TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS quiz_history (seq INTEGER PRIMARY KEY, item TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS documents (seq INTEGER PRIMARY KEY, text TEXT NOT NULL);
+"""
+
+# Small scalar/dict state kept as JSON values in the kv table
+KV_KEYS = ("score", "agent_metrics", "chat_summary", "chat_summary_upto")
+SESSION_FILE = "session.db"  # file name inside each user's directory
+USER_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class SessionStore:
+    """
+    SQLite (WAL mode) session persistence with one table per kind of state.
+    Chat and quiz history are append-only rows, so a save writes only
+    what changed since the last flush. Saves are staged and flushed together after
+    `debounce` seconds (or on flush()/exit), each flush being one transaction.
+    """
+
+    def __init__(self, path, debounce=1.0):
+        self.path = path
+        self.debounce = debounce
+        self._lock = threading.RLock()
+        self._conn = None
+        self._pending = {}
+        self._timer = None
+        self._db()
+
+    def _db(self):
+        """
+        The open connection. A store closed by idle eviction may still be held by a script run
+        that started before it; that run's next read or write reopens it and resyncs from disk.
+        """
+        with self._lock:
+            if self._conn is None:
+                conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.execute("PRAGMA busy_timeout=5000")  # another process writing the same user waits, not fails
+                conn.executescript(SCHEMA)
+                self._conn = conn
+                self._synced = self._scan()
+                atexit.register(self.flush)
+            return self._conn
+
+    def _scan(self):
+        """What is already on disk: row counts, document length and raw kv values."""
+        cur = self._conn
+        return {
+            "chat": cur.execute("SELECT COUNT(*) FROM chat").fetchone()[0],
+            "quiz_history": cur.execute("SELECT COUNT(*) FROM quiz_history").fetchone()[0],
+            "rag_docs": cur.execute("SELECT COALESCE(SUM(LENGTH(text)), 0) FROM documents").fetchone()[0],
+            "kv": dict(cur.execute("SELECT key, value FROM kv").fetchall()),
+        }
+
+    def is_empty(self):
+        return not (self._synced["kv"] or self._synced["chat"] or self._synced["rag_docs"])
+
+    # --- READS ---
+    def load_state(self):
+        """Everything except legacy document text (see load_documents)."""
+        with self._lock:
+            self.flush()
+            data = {k: json.loads(v) for k, v in self._synced["kv"].items()}
+            data["chat_history"] = [{"role": r, "content": c} for r, c in
+                                    self._db().execute("SELECT role, content FROM chat ORDER BY seq")]
+            data["quiz_history"] = [json.loads(item) for (item,) in
+                                    self._db().execute("SELECT item FROM quiz_history ORDER BY seq")]
+            return data
+
+    def load_documents(self):
+        """Corpus text saved by versions before the DocumentStore (empty once migrated)."""
+        with self._lock:
+            self.flush()
+            return "".join(t for (t,) in self._db().execute("SELECT text FROM documents ORDER BY seq"))
+
+    def clear_documents(self):
+        with self._lock:
+            self.flush()
+            self._db().execute("DELETE FROM documents")
+            self._synced["rag_docs"] = 0
+
+    # --- WRITES ---
+    def stage(self, snapshot):
+        """Queues a state snapshot; the next flush writes only the delta against disk."""
+        with self._lock:
+            self._pending.update(snapshot)
+            if self._timer is None and self.debounce > 0:
+                self._timer = threading.Timer(self.debounce, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+            elif self.debounce <= 0:
+                self.flush()
+
+    def flush(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            pending, self._pending = self._pending, {}
+            if not pending: return
+            try:
+                self._write(pending)
+            except Exception as e:
+                logging.error(f"Failed to save state: {e}")
+                try:
+                    self._synced = self._scan()  # resync after the rolled-back transaction
+                except sqlite3.Error as e:
+                    logging.error(f"Session DB unusable, reopening on next use: {e}")
+                    self._conn = None
+
+    def close(self):
+        """Flushes pending writes and releases the connection (used by idle eviction; reopened if used again)."""
+        with self._lock:
+            self.flush()
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+                atexit.unregister(self.flush)
+
+    def _write(self, state):
+        cur = self._db()
+        synced = dict(self._synced, kv=dict(self._synced["kv"]))
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            for key in KV_KEYS:
+                if key not in state: continue
+                value = json.dumps(state[key])
+                if synced["kv"].get(key) != value:
+                    cur.execute("INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)", (key, value))
+                    synced["kv"][key] = value
+
+            if "chat_history" in state:
+                history = state["chat_history"]
+                if len(history) < synced["chat"]:
+                    cur.execute("DELETE FROM chat")
+                    synced["chat"] = 0
+                cur.executemany("INSERT INTO chat (seq, role, content) VALUES (?, ?, ?)",
+                                [(i, m["role"], m["content"]) for i, m in enumerate(history) if i >= synced["chat"]])
+                synced["chat"] = len(history)
+
+            if "quiz_history" in state:
+                items = state["quiz_history"]
+                if len(items) < synced["quiz_history"]:
+                    cur.execute("DELETE FROM quiz_history")
+                    synced["quiz_history"] = 0
+                cur.executemany("INSERT INTO quiz_history (seq, item) VALUES (?, ?)",
+                                [(i, json.dumps(it)) for i, it in enumerate(items) if i >= synced["quiz_history"]])
+                synced["quiz_history"] = len(items)
+
+            if "rag_docs" in state:  # legacy corpus blob, only written by import_legacy_json now
+                docs = state["rag_docs"]
+                if len(docs) < synced["rag_docs"]:
+                    cur.execute("DELETE FROM documents")
+                    synced["rag_docs"] = 0
+                if len(docs) > synced["rag_docs"]:
+                    # rag_docs only ever grows by appending uploads, so store just the new tail
+                    cur.execute("INSERT INTO documents (text) VALUES (?)", (docs[synced["rag_docs"]:],))
+                synced["rag_docs"] = len(docs)
+            cur.execute("COMMIT")
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+        self._synced = synced
+
+    def import_legacy_json(self, path):
+        """One-off migration from the old single-file user_session_state.json (left in place)."""
+        if not self.is_empty() or not os.path.exists(path): return False
+        with open(path, "r") as f:
+            data = json.load(f)
+        with self._lock:
+            self._write(data)
+        logging.info(f"Migrated {path} into {self.path}")
+        return True
+
+
+class SessionRegistry:
+    """
+    One SessionStore per user, each in its own SQLite file so students never contend
+    for the same lock. Files are sharded as <root>/<shard>/<user_id>/session.db, the
+    shard being the first two hex digits of the id's SHA-256. Stores unused for
+    `idle_seconds` (or beyond `max_open`) are flushed and closed.
+    """
+
+    def __init__(self, root, debounce=1.0, idle_seconds=900, max_open=512, on_open=None):
+        self.root = root
+        self.debounce = debounce
+        self.idle_seconds = idle_seconds
+        self.max_open = max_open
+        self.on_open = on_open  # called as on_open(user_id, store) when a store is (re)opened
+        self._stores = OrderedDict()  # user_id -> (store, last_used), least recently used first
+        self._lock = threading.Lock()
+        self._last_sweep = time.time()
+
+    def user_dir(self, user_id):
+        """Per-user directory for the session DB and any other per-user files (index, vectors)."""
+        if not USER_ID.match(user_id or ""):
+            raise ValueError(f"Invalid user id: {user_id!r}")
+        shard = hashlib.sha256(user_id.encode("utf-8")).hexdigest()[:2]
+        path = os.path.join(self.root, shard, user_id)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def get(self, user_id):
+        now = time.time()
+        with self._lock:
+            entry = self._stores.pop(user_id, None)
+            store = entry[0] if entry else None
+            if store is None:
+                store = SessionStore(os.path.join(self.user_dir(user_id), SESSION_FILE), debounce=self.debounce)
+            self._stores[user_id] = (store, now)
+            stale = self._collect_stale(now)
+        for old in stale:
+            old.close()
+        if entry is None and self.on_open is not None:
+            try:
+                self.on_open(user_id, store)
+            except Exception as e:
+                logging.error(f"Session open hook failed for {user_id}: {e}")
+        return store
+
+    def _collect_stale(self, now):
+        """Pops idle stores (checked at most once a minute) and any beyond max_open. Caller holds the lock."""
+        stale = []
+        if now - self._last_sweep >= min(60, self.idle_seconds):
+            self._last_sweep = now
+            for user_id, (store, last_used) in list(self._stores.items()):
+                if now - last_used > self.idle_seconds:
+                    stale.append(self._stores.pop(user_id)[0])
+        while len(self._stores) > self.max_open:
+            stale.append(self._stores.popitem(last=False)[1][0])
+        return stale
+
+    def adopt_legacy_db(self, path, user_id):
+        """Moves a pre-registry single-user session DB into `user_id`'s slot, if that slot is still empty."""
+        target = os.path.join(self.user_dir(user_id), SESSION_FILE)
+        if not os.path.exists(path) or os.path.exists(target): return False
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")  # fold the WAL into the main file before moving it
+        conn.close()
+        os.replace(path, target)
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(path + suffix): os.remove(path + suffix)
+        logging.info(f"Moved {path} to {target}")
+        return True
@@ -1,121 +1,317 @@
 import streamlit as st
 import google.generativeai as genai
 import logging
-import PyPDF2
-import json
-import difflib
 import time
 import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from rag_index import Chunker, BM25Index, fuse_rankings
+from vector_store import VectorStore, HashingEmbedder
+from pdf_pipeline import PDFPipeline, file_sha256
+from agents import (BaseAgent, DocumentIngestionTool, GraderAgent, HybridQA_Agent, ProfessorAgent, TutorAgent,
+                    set_default_gateway)
+from session_store import SessionRegistry
+from doc_store import DocumentStore
+from question_bank import QuestionBank, review_quality
+from llm_gateway import ModelGateway, ResponseCache, RateLimiter
+from grading import LocalGrader, parse_grader_reply
+from telemetry import Telemetry
+from context_packer import ContextPacker
 
 # --- CONFIGURATION ---
-st.set_page_config(page_title="Neural RAG Tutor", page_icon="🧠", layout="wide")
 logging.basicConfig(level=logging.INFO)
 
 # --- CONSTANTS ---
-SESSION_FILE = "user_session_state.json"
+SESSIONS_DIR = "sessions"  # sessions/<shard>/<user_id>/ holds each student's DB, index and vectors
+LEGACY_SESSION_DB = "user_session_state.db"  # pre-registry single-user DB, adopted by LEGACY_USER_ID
+LEGACY_SESSION_FILE = "user_session_state.json"  # pre-SQLite format, imported once
+LEGACY_USER_ID = "default"  # open the app with ?sid=default to get the old single-user session back
+SAVE_DEBOUNCE_SECONDS = 1.0
+SESSION_IDLE_SECONDS = 15 * 60  # open session stores unused this long are flushed and closed
+MAX_DOC_CHARS_PER_USER = 20_000_000  # ~20 MB of unique extracted text per student
+LLM_CACHE_DB = "llm_cache.db"  # on-disk tier of the LLM response cache
+LLM_REQUESTS_PER_MINUTE = 120  # process-wide; the quota belongs to the API key, not to a student
+LLM_BURST = 10
+LLM_MAX_CONCURRENT = 4  # in-flight Gemini calls per process (also the background worker count)
+CHAT_PAGE_SIZE = 30  # chat messages rendered per page; older pages load on demand
+QUIZ_HISTORY_PAGE_SIZE = 10  # past questions rendered per page
+PREFETCH_HINTS = True  # ask the Tutor for a hint while the student reads the question
+BACKGROUND_WAIT_SECONDS = 10  # longest a click waits on a running prefetch before calling the model itself
+TRACE_FILE = "agent_traces.jsonl"  # span export target (written only on export)
+DOCSTORE_FILE = "documents.db"  # per-user compressed, deduplicated page store
+QUESTION_BANK_FILE = "question_bank.db"  # per-user asked questions + spaced-repetition schedule
+INDEX_FILE = "rag_index.json"  # BM25 index persisted next to the user's session file
+VECTOR_FILE = "rag_vectors"  # -> rag_vectors.npy (mmap) + rag_vectors.meta.json, also per user
+RETRIEVAL_TOP_K = 6
+# Context token budget per agent (replaces the old 100k/50k/20k character slices)
+AGENT_CONTEXT_BUDGETS = {"HybridQA_Agent": 6000, "ProfessorAgent": 4000, "TutorAgent": 3000, "GraderAgent": 2000}
+CONTEXT_SECTIONS = ("PDF PASSAGES", "PREVIOUS CONVERSATION SUMMARY", "RECENT MESSAGES")
 
 # --- STATE MANAGEMENT & PERSISTENCE ---
+DEFAULT_METRICS = {"calls": 0, "avg_latency": 0.0, "positive_feedback": 0, "negative_feedback": 0}
+
+def _import_legacy_session(user_id, store):
+    if user_id == LEGACY_USER_ID:
+        store.import_legacy_json(LEGACY_SESSION_FILE)
+
+@st.cache_resource
+def get_session_registry():
+    """Per-user session stores for the whole process; the old single-user files go to LEGACY_USER_ID."""
+    registry = SessionRegistry(SESSIONS_DIR, debounce=SAVE_DEBOUNCE_SECONDS, idle_seconds=SESSION_IDLE_SECONDS,
+                               on_open=_import_legacy_session)
+    try:
+        registry.adopt_legacy_db(LEGACY_SESSION_DB, LEGACY_USER_ID)
+    except Exception as e:
+        logging.error(f"Failed to migrate {LEGACY_SESSION_DB}: {e}")
+    return registry
+
+def get_user_id():
+    """
+    Stable id for this student: the ?sid= query parameter, or a new random one that is
+    written back to the URL so a reload (or bookmark) returns to the same session.
+    """
+    if "user_id" not in st.session_state:
+        sid = st.query_params.get("sid", "")
+        try:
+            get_session_registry().user_dir(sid)
+        except ValueError:
+            sid = uuid.uuid4().hex
+            st.query_params["sid"] = sid
+        st.session_state.user_id = sid
+    return st.session_state.user_id
+
+def get_session_store():
+    return get_session_registry().get(get_user_id())
+
+def user_path(name):
+    """Path of a per-user file (index, vectors) next to the user's session DB."""
+    return os.path.join(get_session_registry().user_dir(get_user_id()), name)
+
 class SessionManager:
     """Handles saving/loading state to disk for persistence across reloads."""
     
     @staticmethod
     def save_state():
-        """Saves critical session data to a local JSON file."""
+        """
+        Stages the session for a debounced flush to SQLite.
+        Only rows/values that changed since the last flush are written.
+        """
         state_data = {
             "score": st.session_state.get("score", 0),
-            "chat_history": st.session_state.get("chat_history", []),
-            "quiz_history": st.session_state.get("quiz_history", []),
-            "rag_docs": st.session_state.get("rag_docs", ""),
-            "agent_metrics": st.session_state.get("agent_metrics", {"calls": 0, "avg_latency": 0.0, "positive_feedback": 0, "negative_feedback": 0}),
-            "chat_summary": st.session_state.get("chat_summary", "") # Persist the summary too
+            "chat_history": list(st.session_state.get("chat_history", [])),
+            "quiz_history": list(st.session_state.get("quiz_history", [])),
+            "agent_metrics": dict(st.session_state.get("agent_metrics", DEFAULT_METRICS)),
+            "chat_summary": st.session_state.get("chat_summary", ""), # Persist the summary too
+            "chat_summary_upto": st.session_state.get("chat_summary_upto", 0) # Messages already folded into it
         }
-        try:
-            with open(SESSION_FILE, "w") as f:
-                json.dump(state_data, f)
-            logging.info("State saved to disk.")
-        except Exception as e:
-            logging.error(f"Failed to save state: {e}")
+        get_session_store().stage(state_data) # Documents live in the DocumentStore, written at ingestion
+
+    @staticmethod
+    def flush():
+        """Writes any staged changes now (called once at the end of each script run)."""
+        get_session_store().flush()
 
     @staticmethod
     def load_state():
-        """Loads session data from disk if available."""
-        if os.path.exists(SESSION_FILE):
+        """Loads session data from disk if available. Documents stay on disk (get_document_store)."""
+        store = get_session_store()
+        data = {}
+        if not store.is_empty():
             try:
-                with open(SESSION_FILE, "r") as f:
-                    data = json.load(f)
-                
-                # Restore state
-                if 'score' not in st.session_state: st.session_state.score = data.get("score", 0)
-                if 'chat_history' not in st.session_state: st.session_state.chat_history = data.get("chat_history", [])
-                if 'quiz_history' not in st.session_state: st.session_state.quiz_history = data.get("quiz_history", [])
-                if 'rag_docs' not in st.session_state: st.session_state.rag_docs = data.get("rag_docs", "")
-                if 'agent_metrics' not in st.session_state: st.session_state.agent_metrics = data.get("agent_metrics", {"calls": 0, "avg_latency": 0.0, "positive_feedback": 0, "negative_feedback": 0})
-                if 'chat_summary' not in st.session_state: st.session_state.chat_summary = data.get("chat_summary", "")
-                
-                st.toast("🔄 Session Restored from Memory")
+                data = store.load_state()
+                if 'score' not in st.session_state: st.toast("🔄 Session Restored from Memory")
             except Exception as e:
                 logging.error(f"Failed to load state: {e}")
-        else:
-            # Initialize defaults if no file exists
-            if 'score' not in st.session_state: st.session_state.score = 0
-            if 'chat_history' not in st.session_state: st.session_state.chat_history = []
-            if 'quiz_history' not in st.session_state: st.session_state.quiz_history = []
-            if 'rag_docs' not in st.session_state: st.session_state.rag_docs = ""
-            if 'agent_metrics' not in st.session_state: st.session_state.agent_metrics = {"calls": 0, "avg_latency": 0.0, "positive_feedback": 0, "negative_feedback": 0}
-            if 'chat_summary' not in st.session_state: st.session_state.chat_summary = ""
-
-# Load state immediately on startup
-SessionManager.load_state()
-
-# Initialize transient UI state (things that don't need to be saved to disk)
-if 'quiz_data' not in st.session_state: st.session_state.quiz_data = None
-if 'quiz_answered' not in st.session_state: st.session_state.quiz_answered = False
-if 'active_hint' not in st.session_state: st.session_state.active_hint = None
-if 'current_user_answer' not in st.session_state: st.session_state.current_user_answer = None
+
+        # Restore state (defaults if nothing was saved)
+        if 'score' not in st.session_state: st.session_state.score = data.get("score", 0)
+        if 'chat_history' not in st.session_state: st.session_state.chat_history = data.get("chat_history", [])
+        if 'quiz_history' not in st.session_state: st.session_state.quiz_history = data.get("quiz_history", [])
+        if 'agent_metrics' not in st.session_state: st.session_state.agent_metrics = data.get("agent_metrics", dict(DEFAULT_METRICS))
+        if 'chat_summary' not in st.session_state: st.session_state.chat_summary = data.get("chat_summary", "")
+        if 'chat_summary_upto' not in st.session_state: st.session_state.chat_summary_upto = data.get("chat_summary_upto", 0)
+
+@st.cache_resource(ttl=SESSION_IDLE_SECONDS, max_entries=512)
+def _open_document_store(path):
+    return DocumentStore(path)
+
+def get_document_store():
+    """
+    The student's page store (shared by their tabs). Corpora saved by older versions as one
+    text blob in the session DB are moved into it the first time it is opened.
+    """
+    store = _open_document_store(user_path(DOCSTORE_FILE))
+    if not st.session_state.get("documents_migrated"):
+        st.session_state.documents_migrated = True
+        session = get_session_store()
+        legacy = session.load_documents()
+        if legacy:
+            try:
+                if store.is_empty():
+                    chunker = Chunker()
+                    for name, doc_text in chunker.split_documents(legacy):
+                        pages = list(chunker.split_pages(doc_text))
+                        store.add_document(name, file_sha256(doc_text.encode("utf-8")), pages)
+                session.clear_documents()
+                logging.info("Moved legacy corpus into the document store")
+            except Exception as e:
+                logging.error(f"Failed to migrate legacy documents: {e}")
+    return store
+
+@st.cache_resource(ttl=SESSION_IDLE_SECONDS, max_entries=512)
+def _open_question_bank(path):
+    return QuestionBank(path)
+
+def get_question_bank():
+    """The student's question bank: every question asked so far, with its review schedule."""
+    return _open_question_bank(user_path(QUESTION_BANK_FILE))
+
+def init_session():
+    """Restores the saved session and sets transient UI defaults (called at the start of every run)."""
+    SessionManager.load_state()
+    # Transient UI state (things that don't need to be saved to disk)
+    if 'quiz_data' not in st.session_state: st.session_state.quiz_data = None
+    if 'quiz_bank_id' not in st.session_state: st.session_state.quiz_bank_id = None
+    if 'quiz_review' not in st.session_state: st.session_state.quiz_review = False
+    if 'quiz_answered' not in st.session_state: st.session_state.quiz_answered = False
+    if 'active_hint' not in st.session_state: st.session_state.active_hint = None
+    if 'current_user_answer' not in st.session_state: st.session_state.current_user_answer = None
+
+# --- MODEL GATEWAY ---
+@st.cache_resource
+def get_telemetry():
+    """Process-wide span ring buffer + per-agent latency histograms."""
+    return Telemetry()
+
+@st.cache_resource
+def get_model_gateway():
+    """One gateway (model objects, response cache, rate limiter) per process, shared by every agent and student."""
+    return ModelGateway(ResponseCache(LLM_CACHE_DB), telemetry=get_telemetry(),
+                        rate_limiter=RateLimiter(LLM_REQUESTS_PER_MINUTE / 60, burst=LLM_BURST),
+                        max_concurrent=LLM_MAX_CONCURRENT)
+
+set_default_gateway(get_model_gateway) # Agents created without a gateway use the cached one
+
+@st.cache_resource
+def get_pdf_pipeline():
+    return PDFPipeline()
+
+@st.cache_resource
+def get_background_executor():
+    """Shared worker threads for LLM work that should not block a script run."""
+    return ThreadPoolExecutor(max_workers=LLM_MAX_CONCURRENT, thread_name_prefix="study-buddy-bg")
+
+def wait_for_background(job, timeout=BACKGROUND_WAIT_SECONDS):
+    """
+    Result of a background job a student is now waiting on. The pool is shared by every student,
+    so a job still queued behind other work is cancelled and a running one gets at most `timeout`
+    seconds; both raise FuturesTimeoutError and the caller makes the call directly instead.
+    """
+    if job.cancel():
+        raise FuturesTimeoutError("job had not started; cancelled")
+    return job.result(timeout=timeout)
 
 # --- NEW: CONTEXT COMPRESSOR (Latency Reduction) ---
-class ContextCompressor:
-    """Summarizes older context to reduce token usage and latency."""
-    
-    def compress_chat_history(self, history):
-        """Compresses chat history if it's too long."""
-        # Only compress if we have more than 5 messages
-        if len(history) <= 5:
-            return None, history # No summary needed yet
-
-        # Keep last 3 messages raw, summarize the rest
-        older_msgs = history[:-3]
-        recent_msgs = history[-3:]
-        
-        # Prepare text to summarize
-        text_to_compress = "\n".join([f"{msg['role']}: {msg['content']}" for msg in older_msgs])
-        
-        model = genai.GenerativeModel('gemini-2.5-flash')
+class ContextCompressor(BaseAgent):
+    """
+    Maintains a rolling summary of older chat turns.
+    `chat_summary_upto` is the watermark: history[:upto] is already folded into chat_summary,
+    so each refresh only summarizes the new delta together with the previous summary.
+    """
+    KEEP_RECENT = 3  # newest messages always stay verbatim
+    MIN_HISTORY = 5  # no summary until the chat is longer than this
+    SUMMARY_MAX_TOKENS = 300  # hard budget for chat_summary (~4 chars per token)
+
+    def summarize_delta(self, previous_summary, new_msgs, upto):
+        """Runs on a worker thread: must not touch st.session_state. Returns (summary, upto)."""
+        text_to_compress = "\n".join([f"{msg['role']}: {msg['content']}" for msg in new_msgs])
         prompt = f"""
         Summarize the following conversation history into a concise paragraph. 
         Focus on the key topics studied and the user's learning gaps.
+        Merge the NEW MESSAGES into the PREVIOUS SUMMARY. Use at most {int(self.SUMMARY_MAX_TOKENS * 0.75)} words.
+        
+        PREVIOUS SUMMARY:
+        {previous_summary or "(none)"}
         
-        CONVERSATION:
+        NEW MESSAGES:
         {text_to_compress}
         """
-        try:
-            summary = model.generate_content(prompt).text.strip()
-            return summary, recent_msgs
-        except:
-            return None, history # Fallback if API fails
+        summary = self.ask(prompt)
+        return self.enforce_budget(summary), upto
+
+    def enforce_budget(self, summary):
+        """Cuts the summary to SUMMARY_MAX_TOKENS, preferring a sentence boundary."""
+        limit = self.SUMMARY_MAX_TOKENS * 4
+        if len(summary) <= limit:
+            return summary
+        cut = summary[:limit]
+        end = cut.rfind(". ")
+        return cut[:end + 1] if end > limit // 2 else cut
+
+    def refresh_in_background(self):
+        """Applies a finished summary job, then schedules the next delta if there is one."""
+        job = st.session_state.get("summary_job")
+        if job is not None:
+            if not job.done():
+                return
+            st.session_state.summary_job = None
+            try:
+                summary, upto = job.result()
+                if upto > st.session_state.chat_summary_upto:
+                    st.session_state.chat_summary = summary
+                    st.session_state.chat_summary_upto = upto
+                    SessionManager.save_state()
+            except Exception as e:
+                logging.error(f"Chat summary refresh failed: {e}") # Watermark unchanged, retried next time
+
+        history = st.session_state.chat_history
+        upto = st.session_state.chat_summary_upto
+        target = len(history) - self.KEEP_RECENT
+        if len(history) > self.MIN_HISTORY and target > upto:
+            st.session_state.summary_job = get_background_executor().submit(
+                self.summarize_delta, st.session_state.chat_summary, history[upto:target], target)
 
 # --- TOOLS ---
 class ObservabilityTool:
-    def log_metric(self, agent_name, start_time, success=True):
+    def log_metric(self, agent_name, start_time, success=True, ttft=None):
         duration = time.time() - start_time
         st.session_state.agent_metrics["calls"] += 1
         prev_avg = st.session_state.agent_metrics["avg_latency"]
         n = st.session_state.agent_metrics["calls"]
         new_avg = (prev_avg * (n-1) + duration) / n
         st.session_state.agent_metrics["avg_latency"] = new_avg
+        if ttft is not None:
+            # Time-to-first-token of streamed answers, tracked separately from total latency
+            m = st.session_state.agent_metrics
+            m["ttft_calls"] = m.get("ttft_calls", 0) + 1
+            m["avg_ttft"] = (m.get("avg_ttft", 0.0) * (m["ttft_calls"] - 1) + ttft) / m["ttft_calls"]
+            logging.info(f"🔭 TRACE: {agent_name} first token after {ttft:.2f}s")
         logging.info(f"🔭 TRACE: {agent_name} finished in {duration:.2f}s")
-        # Auto-save on metric update
-        SessionManager.save_state()
+        # No save here: metrics are persisted with the next state save, keeping disk off the hot path
+
+    def log_grading_tier(self, tier, start_time):
+        """Counts which grading tier ('local' or 'llm') decided an answer, and how long it took."""
+        duration = time.time() - start_time
+        tiers = st.session_state.agent_metrics.setdefault("grading_tiers", {})
+        t = tiers.setdefault(tier, {"count": 0, "avg_latency": 0.0})
+        t["count"] += 1
+        t["avg_latency"] = (t["avg_latency"] * (t["count"] - 1) + duration) / t["count"]
+        if tier == "local": # LLM-tier calls already produce a GraderAgent span in the gateway
+            get_telemetry().record("LocalGrader", duration)
+        logging.info(f"🔭 TRACE: grading decided by {tier} tier in {duration:.3f}s")
+
+    def track_stream(self, agent_name, chunks):
+        """Passes a chunk stream through, logging time-to-first-token and total latency when it ends."""
+        start = time.time()
+        ttft = None
+        success = False
+        try:
+            for chunk in chunks:
+                if ttft is None: ttft = time.time() - start
+                yield chunk
+            success = True
+        finally:
+            self.log_metric(agent_name, start, success=success, ttft=ttft)
 
 class EvaluationTool:
     def log_feedback(self, is_positive):
@@ -127,73 +323,134 @@ class EvaluationTool:
             st.toast("📉 Negative feedback logged.")
         SessionManager.save_state()
 
-class DocumentIngestionTool:
-    def process_files(self, uploaded_files):
-        total_text = ""
-        success_count = 0
-        for file in uploaded_files:
-            try:
-                reader = PyPDF2.PdfReader(file)
-                file_text = f"\n--- START OF DOCUMENT: {file.name} ---\n"
-                for page in reader.pages: 
-                    extracted = page.extract_text()
-                    if extracted: file_text += extracted + "\n"
-                if len(file_text) > 100:
-                    total_text += file_text
-                    success_count += 1
-            except: pass
-        if success_count > 0:
-            SessionManager.save_state() # Save immediately after upload
-            return total_text
-        return None
+# --- HELPER: RETRIEVAL INDEX ---
+def chunk_documents():
+    """Chunks of every distinct page in the document store, with text (used to build the indexes)."""
+    return Chunker().chunk_pages(get_document_store().iter_unique_pages())
+
+def hydrate(hits):
+    """
+    Index chunks carry no text (it stays compressed in the DocumentStore), so the few that
+    are actually used get theirs re-derived from their page here.
+    """
+    store = get_document_store()
+    hydrated = []
+    for chunk, score in hits:
+        if "text" not in chunk:
+            page = Chunker().chunk_pages([(chunk["doc"], chunk["page"], store.page_text(chunk["content"]), chunk["content"])])
+            chunk = dict(chunk, text=page[chunk["part"]]["text"] if chunk["part"] < len(page) else "")
+        hydrated.append((chunk, score))
+    return hydrated
+
+def get_rag_index():
+    """
+    Returns the BM25 index for the current document store.
+    Cached in session_state and on disk, so it is only rebuilt when documents are added or removed.
+    """
+    fingerprint = get_document_store().fingerprint()
+    index = st.session_state.get("rag_index")
+    if index is not None and index.fingerprint == fingerprint:
+        return index
+    index = None
+    index_file = user_path(INDEX_FILE)
+    if os.path.exists(index_file):
+        try:
+            index = BM25Index.load(index_file)
+        except Exception as e:
+            logging.error(f"Failed to load index: {e}")
+    if index is None or index.fingerprint != fingerprint:
+        chunks = chunk_documents()
+        index = BM25Index().build(chunks, fingerprint)
+        st.session_state.rag_vectors = build_vector_store(chunks, fingerprint) # Embed while the text is at hand
+        for chunk in chunks: del chunk["text"] # The index keeps ids only; text is fetched per hit
+        try:
+            index.save(index_file)
+        except Exception as e:
+            logging.error(f"Failed to save index: {e}")
+    st.session_state.rag_index = index
+    return index
+
+def get_vector_store(index):
+    """Dense embeddings for the index chunks, memory-mapped from disk when the corpus is unchanged."""
+    store = st.session_state.get("rag_vectors")
+    if store is not None and store.fingerprint == index.fingerprint:
+        return store
+    store = None
+    vector_file = user_path(VECTOR_FILE)
+    if os.path.exists(vector_file + ".npy"):
+        try:
+            store = VectorStore.load(vector_file, HashingEmbedder())
+        except Exception as e:
+            logging.error(f"Failed to load vector store: {e}")
+    if store is None or store.fingerprint != index.fingerprint:
+        store = build_vector_store(chunk_documents(), index.fingerprint)
+    st.session_state.rag_vectors = store
+    return store
+
+def build_vector_store(chunks, fingerprint):
+    store = VectorStore(HashingEmbedder())
+    store.add([c["id"] for c in chunks], [c["text"] for c in chunks], [{"doc": c["doc"], "page": c["page"]} for c in chunks])
+    store.fingerprint = fingerprint
+    try:
+        store.save(user_path(VECTOR_FILE))
+    except Exception as e:
+        logging.error(f"Failed to save vector store: {e}")
+    return store
+
+def retrieve_hits(query=None, top_k=RETRIEVAL_TOP_K):
+    """
+    Top-k (chunk, score) PDF passages for the query (or a random spread when there is no query).
+    Keyword (BM25) and semantic (dense) rankings are merged with reciprocal rank fusion.
+    """
+    if get_document_store().is_empty():
+        return []
+    index = get_rag_index()
+    hits = []
+    if query:
+        keyword_ids = [c["id"] for c, _ in index.search(query, top_k * 2)]
+        dense_ids = [cid for cid, _, _ in get_vector_store(index).search([query], top_k * 2)[0]]
+        hits = [(index.chunks[cid], 0.0) for cid in fuse_rankings([keyword_ids, dense_ids])[:top_k]]
+    if not hits:
+        hits = index.sample(top_k)
+    return hydrate(hits)
 
 # --- HELPER: OPTIMIZED CONTEXT MANAGER ---
-def get_study_context(selected_sources):
+def get_study_context(selected_sources, query=None, top_k=RETRIEVAL_TOP_K, agent="ProfessorAgent", budget=None):
     """
-    Combines PDF + Optimized Chat History.
-    Uses 'Context Compaction' (Summarization) to reduce latency.
+    Assembles PDF passages + Optimized Chat History within the agent's token budget.
+    Priority: current question (reserved), recent messages (newest first), rolling summary,
+    then passages by relevance. What was included/dropped is kept in context_reports[agent].
     """
-    combined_context = ""
-    
-    # 1. Add PDF Data
-    if "Uploaded PDF(s)" in selected_sources:
-        combined_context += st.session_state.rag_docs if st.session_state.rag_docs else ""
+    budget = budget or AGENT_CONTEXT_BUDGETS.get(agent, 4000)
+    packer = ContextPacker(budget, sections=CONTEXT_SECTIONS)
+    packer.add("QUESTION", query, priority=0, label="current question", emit=False)
 
-    # 2. Add Chat History (Optimized)
+    # 1. Chat History (Optimized): summary + the messages it does not cover yet
     if "My Chat History" in selected_sources:
         history = st.session_state.chat_history
         if history:
-            # Check if we need to update the summary
-            if len(history) > 5:
-                compressor = ContextCompressor()
-                new_summary, recent_msgs = compressor.compress_chat_history(history)
-                
-                if new_summary:
-                    st.session_state.chat_summary = new_summary # Update stored summary
-                    
-                    # Construct Context: Summary + Recent Messages
-                    chat_log = f"\n--- PREVIOUS CONVERSATION SUMMARY ---\n{st.session_state.chat_summary}\n"
-                    chat_log += "\n--- RECENT MESSAGES ---\n"
-                    for msg in recent_msgs:
-                        chat_log += f"{msg['role'].upper()}: {msg['content']}\n"
-                    combined_context += chat_log
-                    
-                    # Debug output to show judges the optimization
-                    # print(f"Context Compressed! Summary: {new_summary[:50]}...") 
-                else:
-                    # Fallback to full history
-                    for msg in history:
-                        combined_context += f"{msg['role'].upper()}: {msg['content']}\n"
-            else:
-                # Short history, just append
-                chat_log = "\n--- SESSION CHAT HISTORY ---\n"
-                for msg in history:
-                    chat_log += f"{msg['role'].upper()}: {msg['content']}\n"
-                combined_context += chat_log
-
+            # Fold older turns into the rolling summary without waiting for the LLM
+            ContextCompressor().refresh_in_background()
+            upto = st.session_state.chat_summary_upto if st.session_state.chat_summary else 0
+            tail = history[upto:]
+            for age, msg in enumerate(reversed(tail)): # newest first, so the oldest are dropped first
+                packer.add("RECENT MESSAGES", f"{msg['role'].upper()}: {msg['content']}", priority=1 + age / 10000,
+                           label=f"message {len(history) - age}", order=len(history) - age)
+            packer.add("PREVIOUS CONVERSATION SUMMARY", st.session_state.chat_summary if upto else "", priority=2, label="chat summary")
+
+    # 2. PDF Data (only the passages relevant to the query)
+    if "Uploaded PDF(s)" in selected_sources:
+        for rank, (chunk, _) in enumerate(retrieve_hits(query, top_k)):
+            label = f"{chunk['doc']} p.{chunk['page']}" if chunk.get("page") else chunk["doc"]
+            packer.add("PDF PASSAGES", BM25Index.format_passages([(chunk, 0.0)]), priority=3 + rank / 10000, label=label, order=rank)
+
+    combined_context, report = packer.pack()
+    st.session_state.setdefault("context_reports", {})[agent] = report
+    if report["dropped"]:
+        logging.info(f"📦 {agent} context: {report['used']}/{budget} tokens, dropped {len(report['dropped'])} segment(s)")
     return combined_context if combined_context else None
 
-# --- AGENTS (UNCHANGED LOGIC, JUST RE-ADDED FOR COMPLETENESS) ---
+# --- QUIZ FLOW (agents themselves live in agents.py) ---
 
 def archive_current_question(user_answer, feedback, correct):
     if st.session_state.quiz_data:
@@ -206,117 +463,263 @@ def archive_current_question(user_answer, feedback, correct):
             "correct": correct,
             "explanation": st.session_state.quiz_data.get('explanation', '')
         })
+        if st.session_state.get("quiz_bank_id") is not None: # Schedules the next review of this question
+            get_question_bank().review(st.session_state.quiz_bank_id, review_quality(correct, skipped=user_answer == "Skipped"))
         SessionManager.save_state() # Save on archive
 
-def generate_new_question(sources, difficulty, q_type):
-    context = get_study_context(sources)
-    if not context:
-        st.error("❌ No data found. Upload a PDF or Chat first!")
-        return
-    
-    prof = ProfessorAgent()
-    with st.spinner("Synthesizing new question..."):
+# --- QUESTION PREFETCH ---
+def _timed_generate_batch(prof, context, specs):
+    """Worker-thread body: returns ([(q_data, fmt), ...], seconds) so the caller can log the latency."""
+    start = time.time()
+    wanted = {ProfessorAgent.FORMATS[q_type] for _, q_type in specs}
+    questions = [(q, fmt) for q, fmt in prof.generate_questions(context, specs) if fmt in wanted]
+    return questions, time.time() - start
+
+class QuestionPrefetcher:
+    """
+    Keeps a small buffer of ready questions for the current (sources, difficulty, q_type),
+    filled on the background executor with one batched ProfessorAgent call per BATCH_SIZE
+    questions. The buffer is dropped whenever the settings, the corpus or (for chat-based
+    quizzes) the chat history change.
+    """
+    DEPTH = 2  # refill when fewer than this many questions are ready or in flight
+    BATCH_SIZE = 5  # questions per LLM call
+
+    def __init__(self):
+        if 'prefetch' not in st.session_state:
+            st.session_state.prefetch = {"key": None, "ready": [], "pending": []}
+        self.state = st.session_state.prefetch
+
+    def _key(self, sources, difficulty, q_type):
+        chat_version = len(st.session_state.chat_history) if "My Chat History" in sources else 0
+        return (tuple(sorted(sources)), difficulty, q_type, get_document_store().fingerprint(), chat_version)
+
+    def _sync(self, key):
+        """Invalidates on key change and moves finished background jobs into the ready buffer."""
+        if self.state["key"] != key:
+            # In-flight jobs for the old key cannot be cancelled; dropping them discards their results
+            self.state.update(key=key, ready=[], pending=[])
+        still_pending = []
+        for job in self.state["pending"]:
+            if not job.done():
+                still_pending.append(job)
+                continue
+            try:
+                questions, seconds = job.result()
+                ObservabilityTool().log_metric("ProfessorAgent", time.time() - seconds)
+                self.state["ready"].extend(questions)
+            except Exception as e:
+                logging.error(f"Question prefetch failed: {e}")
+        self.state["pending"] = still_pending
+
+    def depth(self):
+        return len(self.state["ready"])
+
+    def refill(self, sources, difficulty, q_type):
+        key = self._key(sources, difficulty, q_type)
+        self._sync(key)
+        if len(self.state["ready"]) + self.BATCH_SIZE * len(self.state["pending"]) >= self.DEPTH:
+            return
+        # A batch covers more ground than one question, so give it proportionally more passages
+        context = get_study_context(sources, top_k=min(RETRIEVAL_TOP_K * 2, self.BATCH_SIZE * 3),
+                                    budget=AGENT_CONTEXT_BUDGETS["ProfessorAgent"] * 2)
+        if not context: return
+        specs = [(difficulty, q_type)] * self.BATCH_SIZE
+        self.state["pending"].append(get_background_executor().submit(_timed_generate_batch, ProfessorAgent(), context, specs))
+
+    def _take_ready(self, bank, difficulty, sources):
+        """First buffered question the student has not been asked yet, added to the bank; near-duplicates are dropped."""
+        metrics = st.session_state.agent_metrics
+        while self.state["ready"]:
+            q_data, fmt = self.state["ready"].pop(0)
+            qid, is_new = bank.add(q_data, fmt, difficulty, sources)
+            if is_new:
+                return q_data, fmt, qid, False
+            metrics["bank_duplicates"] = metrics.get("bank_duplicates", 0) + 1
+        return None
+
+    def take(self, sources, difficulty, q_type):
+        """
+        Next question as (q_data, fmt, bank_id, is_review), or None when there is no study material.
+        Questions due for review in the bank come first and cost no LLM call.
+        """
+        key = self._key(sources, difficulty, q_type)
+        self._sync(key)
+        metrics = st.session_state.agent_metrics
+        bank = get_question_bank()
+        due = bank.next_due(ProfessorAgent.FORMATS[q_type], difficulty, sources, exclude={st.session_state.get("quiz_bank_id")})
+        if due is not None:
+            metrics["bank_hits"] = metrics.get("bank_hits", 0) + 1
+            return due["data"], due["format"], due["qid"], True
+        result = self._take_ready(bank, difficulty, sources)
+        if result is not None:
+            metrics["prefetch_hits"] = metrics.get("prefetch_hits", 0) + 1
+            return result
+        metrics["prefetch_misses"] = metrics.get("prefetch_misses", 0) + 1
+        if self.state["pending"]:
+            # Already running: a short wait beats starting a new round-trip (queued jobs are cancelled)
+            job = self.state["pending"].pop(0)
+            try:
+                questions, seconds = wait_for_background(job)
+                ObservabilityTool().log_metric("ProfessorAgent", time.time() - seconds)
+                self.state["ready"].extend(questions)
+            except FuturesTimeoutError as e:
+                logging.warning(f"Question prefetch not ready ({str(e) or 'timed out'}); generating directly")
+            except Exception as e:
+                logging.error(f"Question prefetch failed: {e}")
+            result = self._take_ready(bank, difficulty, sources)
+            if result is not None:
+                return result
+        context = get_study_context(sources)
+        if not context:
+            return None
         start = time.time()
-        q_data, fmt = prof.generate_question(context, difficulty, q_type)
+        q_data, fmt = ProfessorAgent().generate_question(context, difficulty, q_type)
         ObservabilityTool().log_metric("ProfessorAgent", start)
+        qid, _ = bank.add(q_data, fmt, difficulty, sources) # Asked even if it repeats an old one: better than nothing
+        return q_data, fmt, qid, False
+
+# --- HINT PREFETCH ---
+def _timed_hint(tutor, question, context):
+    start = time.time()
+    return tutor.generate_hint(question, context), time.time() - start
+
+def prefetch_hint(sources, question):
+    """Starts the Tutor on this question's hint in the background, so 'Get Hint' is usually instant."""
+    context = get_study_context(sources, query=question, agent="TutorAgent")
+    st.session_state.hint_job = (question, get_background_executor().submit(_timed_hint, TutorAgent(), question, context))
+
+def get_hint(sources, question):
+    """The prefetched hint when there is one for this question (waiting briefly if it is running), else a fresh call."""
+    job = st.session_state.get("hint_job")
+    st.session_state.hint_job = None
+    if job is not None and job[0] == question:
+        try:
+            hint, seconds = wait_for_background(job[1])
+            ObservabilityTool().log_metric("TutorAgent", time.time() - seconds)
+            return hint
+        except FuturesTimeoutError as e:
+            logging.warning(f"Hint prefetch not ready ({str(e) or 'timed out'}); asking the Tutor directly")
+        except Exception as e:
+            logging.error(f"Hint prefetch failed: {e}")
+    context = get_study_context(sources, query=question, agent="TutorAgent")
+    start = time.time()
+    hint = TutorAgent().generate_hint(question, context)
+    ObservabilityTool().log_metric("TutorAgent", start)
+    return hint
+
+def next_question(sources, difficulty, q_type):
+    """
+    The next question (q_data, fmt, bank_id, is_review), or None without study material.
+    Starts the refill and, for new questions, the hint prefetch; a bank review gets its hint
+    only when asked for, so reviews make no Tutor call the student did not request.
+    """
+    prefetcher = QuestionPrefetcher()
+    result = prefetcher.take(sources, difficulty, q_type)
+    if result is None: return None
+    q_data, fmt, bank_id, is_review = result
+    prefetcher.refill(sources, difficulty, q_type) # Start on the next question while this one is answered
+    if PREFETCH_HINTS and not is_review: prefetch_hint(sources, q_data["question"]) # Runs alongside the refill
+    else: st.session_state.hint_job = None
+    return result
+
+def generate_new_question(sources, difficulty, q_type):
+    with st.spinner("Synthesizing new question..."):
+        try:
+            result = next_question(sources, difficulty, q_type)
+        except Exception as e:
+            logging.error(f"Question generation failed: {e}")
+            st.error("❌ The Professor returned an unusable question. Please try again.")
+            return
+        if result is None:
+            st.error("❌ No data found. Upload a PDF or Chat first!")
+            return
+        q_data, fmt, bank_id, is_review = result
         
         st.session_state.quiz_data = q_data
         st.session_state.quiz_format = fmt
+        st.session_state.quiz_bank_id = bank_id
+        st.session_state.quiz_review = is_review
         st.session_state.quiz_answered = False
         st.session_state.active_hint = None
         st.session_state.last_feedback = None
         st.session_state.current_user_answer = None 
         st.rerun()
 
-class HybridQA_Agent:
-    def answer_question(self, question, context):
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        doc_context = context if context else "No documents uploaded."
-        prompt = f"""
-        KNOWLEDGE BASE: {doc_context[:100000]}
-        USER QUESTION: {question}
-        TASK: Answer based on KNOWLEDGE BASE. Cite "📘 **[Source: PDF]**" or "🤖 **[Source: AI]**".
-        """
-        return model.generate_content(prompt).text.strip()
+class TieredGrader:
+    """
+    Grades text answers locally (exact/normalized, numeric tolerance, same key terms) when the
+    verdict is clear; every other answer is sent to GraderAgent.
+    Returns (is_correct, feedback) with feedback prefixed by ✅/❌.
+    """
 
-class ProfessorAgent:
-    def generate_question(self, context, difficulty, q_type):
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        
-        if q_type == "Text-Based":
-            prompt = f"""
-            SOURCE: {context[:50000]}
-            TASK: Create a {difficulty} question based on the SOURCE.
-            OUTPUT FORMAT: Valid JSON only.
-            {{
-                "question": "The question text?",
-                "answer": "The concise, correct answer key."
-            }}
-            """
-            response = model.generate_content(prompt).text.strip()
-            clean_json = response.replace("```json", "").replace("```", "")
-            return json.loads(clean_json), "text"
-            
-        elif q_type == "Multiple Choice (MCQ)":
-            prompt = f"""
-            SOURCE: {context[:50000]}
-            TASK: Create a {difficulty} MCQ based on the SOURCE.
-            
-            OUTPUT FORMAT: Valid JSON only.
-            {{
-                "question": "The question text?",
-                "options": ["Option 1", "Option 2", "Option 3", "Option 4"],
-                "answer": "Option 2",
-                "explanation": "Why this is correct."
-            }}
-            """
-            response = model.generate_content(prompt).text.strip()
-            clean_json = response.replace("```json", "").replace("```", "")
-            data = json.loads(clean_json)
-            
-            options = [str(opt).strip() for opt in data['options']]
-            raw_answer = str(data['answer']).strip()
-            
-            if raw_answer in options:
-                data['answer'] = raw_answer
-            else:
-                matches = difflib.get_close_matches(raw_answer, options, n=1, cutoff=0.8)
-                data['answer'] = matches[0] if matches else options[0]
-            
-            data['options'] = options
-            return data, "json"
-
-class TutorAgent:
-    def generate_hint(self, question, context):
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        prompt = f"""
-        SOURCE MATERIAL: {context[:50000]}
-        QUESTION: {question}
-        TASK: Provide a short, helpful hint without revealing the answer.
-        """
-        return model.generate_content(prompt).text.strip()
+    def __init__(self, local=None):
+        self.local = local or LocalGrader()
 
-class GraderAgent:
-    def grade(self, question, user_answer, model_answer, context):
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        prompt = f"""
-        QUESTION: {question}
-        STUDENT ANSWER: {user_answer}
-        CORRECT ANSWER (FROM KEY): {model_answer}
-        SOURCE CONTEXT: {context[:20000]}
-        
-        TASK: Compare STUDENT ANSWER to CORRECT ANSWER.
-        - Ignore capitalization/punctuation.
-        - If the meaning matches, it is Correct.
-        
-        OUTPUT STRICTLY: IS_CORRECT: [Yes/No] | EXPLANATION: [Short text]
-        """
-        return model.generate_content(prompt).text.strip()
+    def grade(self, question, user_answer, model_answer, sources):
+        start = time.time()
+        verdict, _, reason = self.local.score(user_answer or "", model_answer)
+        if verdict is not None:
+            ObservabilityTool().log_grading_tier("local", start)
+            return verdict, f"{'✅ Correct!' if verdict else '❌ Incorrect.'} {reason}"
+
+        context = get_study_context(sources, query=f"{question} {user_answer} {model_answer}", agent="GraderAgent") or ""
+        grader = GraderAgent()
+        verdict, explanation = parse_grader_reply(grader.grade(question, user_answer, model_answer, context))
+        if verdict is None:
+            # Malformed reply: ask once more, bypassing the cache that may hold the bad reply
+            grader.CACHE_RESPONSES = False
+            reply = grader.grade(question, user_answer, model_answer, context)
+            verdict, explanation = parse_grader_reply(reply)
+        ObservabilityTool().log_metric("GraderAgent", start)
+        ObservabilityTool().log_grading_tier("llm", start)
+        if verdict is None:
+            # Never guess from string similarity ("Type II error" is 96% similar to "Type I error")
+            logging.error(f"Unreadable grader reply: {reply[:200]}")
+            return False, "❌ Not graded: the Grader's reply could not be read. Compare your answer with the key below."
+        return verdict, f"{'✅ Correct!' if verdict else '❌ Incorrect.'} {explanation}"
+
+# --- HISTORY RENDERING ---
+# Only the newest page of each history is rendered, so rerun cost stays flat as histories grow.
+# Both views are fragments: paging back reruns just the view, not the whole app.
+def _show_more(key, page_size, shown):
+    st.session_state[key] = shown + page_size  # on_click callback: applied before the (fragment) rerun
+
+@st.fragment
+def render_chat_history():
+    history = st.session_state.chat_history
+    shown = min(len(history), st.session_state.get("chat_window", CHAT_PAGE_SIZE))
+    if shown < len(history):
+        st.button(f"⬆️ Show older messages ({len(history) - shown} more)", on_click=_show_more,
+                  args=("chat_window", CHAT_PAGE_SIZE, shown))
+    for msg in history[len(history) - shown:]:
+        with st.chat_message(msg["role"]): st.markdown(msg["content"])
+
+@st.fragment
+def render_quiz_history():
+    items = st.session_state.quiz_history
+    if not items: return
+    st.markdown("#### 📜 Past Questions")
+    shown = min(len(items), st.session_state.get("quiz_history_window", QUIZ_HISTORY_PAGE_SIZE))
+    for item in reversed(items[len(items) - shown:]):
+        icon = "✅" if item['correct'] else "❌"
+        with st.expander(f"{icon} Q: {item['question'][:60]}..."):
+            st.markdown(f"**Question:** {item['question']}\n\n**Your Answer:** {item['user_answer']}")
+            if not item['correct']:
+                st.error(f"**Correct Answer:** {item['correct_answer']}")
+            st.caption(f"**Feedback:** {item['feedback']}")
+    if shown < len(items):
+        st.button(f"⬇️ Show older questions ({len(items) - shown} more)", on_click=_show_more,
+                  args=("quiz_history_window", QUIZ_HISTORY_PAGE_SIZE, shown))
+    st.divider()
 
 # --- MAIN UI ---
 def main():
+    st.set_page_config(page_title="Neural RAG Tutor", page_icon="🧠", layout="wide")
+    init_session()
     with st.sidebar:
         st.header("🧠 Neural Config")
+        st.caption(f"🪪 Session `{get_user_id()}`: bookmark this URL to come back to your progress.")
         if "GEMINI_API_KEY" in st.secrets:
             genai.configure(api_key=st.secrets["GEMINI_API_KEY"])
             st.success("API Key Loaded")
@@ -328,17 +731,57 @@ def main():
         if uploaded_files:
             if st.button("Process Files"):
                 with st.spinner("Ingesting..."):
-                    ingestor = DocumentIngestionTool()
-                    text = ingestor.process_files(uploaded_files)
-                    if text:
-                        st.session_state.rag_docs = text
+                    progress = st.progress(0.0)
+                    done = {}
+                    def on_page(name, page_no, total):
+                        done[name] = done.get(name, 0) + 1
+                        progress.progress(min(done[name] / max(total, 1), 1.0), text=f"{name}: page {done[name]}/{total}")
+
+                    store = get_document_store()
+                    ingestor = DocumentIngestionTool(get_pdf_pipeline())
+                    documents = ingestor.process_files(uploaded_files, known_hashes=store.file_hashes(), on_page=on_page)
+                    for report in ingestor.reports:
+                        st.caption(report.summary())
+                        for page_no, err in report.errors[:5]:
+                            st.warning(f"{report.name} p.{page_no or '?'}: {err}")
+                    added = 0
+                    for doc in documents:
+                        result = store.add_document(doc["name"], doc["sha256"], doc["pages"])
+                        if store.total_chars() > MAX_DOC_CHARS_PER_USER: # Counted after dedup, so overlap is free
+                            store.remove_document(result["doc_id"])
+                            st.error(f"❌ {doc['name']} rejected: your knowledge base is limited to {MAX_DOC_CHARS_PER_USER:,} "
+                                     f"characters. Remove a document or clear memory first.")
+                            continue
+                        added += 1
+                        if result["duplicate_pages"]:
+                            st.caption(f"♻️ {doc['name']}: {result['duplicate_pages']}/{result['pages']} pages were already stored")
+                    if added:
+                        get_vector_store(get_rag_index()) # Chunk, index + embed at ingestion time
                         st.success("✅ Files Ingested!")
-        
+                    elif not ingestor.reports:
+                        st.info("These files are already in your knowledge base.")
+
+        documents = get_document_store().documents()
+        if documents:
+            with st.expander(f"📚 Documents ({len(documents)})"):
+                for doc in documents:
+                    c1, c2 = st.columns([5, 1])
+                    c1.caption(f"{doc['name']} · {doc['pages']} pages" +
+                               (f" ({doc['duplicate_pages']} shared)" if doc["duplicate_pages"] else ""))
+                    if c2.button("🗑️", key=f"remove_doc_{doc['doc_id']}", help=f"Remove {doc['name']}"):
+                        get_document_store().remove_document(doc["doc_id"]) # No re-extraction: the index rebuilds from stored pages
+                        st.rerun()
+
         if st.button("🗑️ Clear All Memory"):
-            st.session_state.rag_docs = ""
+            get_document_store().clear()
+            get_question_bank().clear()
             st.session_state.chat_history = []
             st.session_state.quiz_history = []
             st.session_state.chat_summary = ""
+            st.session_state.chat_summary_upto = 0
+            st.session_state.summary_job = None # Drop any in-flight summary of the old chat
+            st.session_state.chat_window = CHAT_PAGE_SIZE
+            st.session_state.quiz_history_window = QUIZ_HISTORY_PAGE_SIZE
             SessionManager.save_state() # Clear disk
             st.rerun()
 
@@ -348,6 +791,32 @@ def main():
             m = st.session_state.agent_metrics
             st.metric("Calls", m["calls"])
             st.metric("Avg Latency (s)", f"{m['avg_latency']:.2f}")
+            if m.get("ttft_calls"):
+                st.metric("Avg Time to First Token (s)", f"{m['avg_ttft']:.2f}")
+            cache = get_model_gateway().cache
+            hits = cache.stats["memory_hits"] + cache.stats["disk_hits"]
+            st.caption(f"💾 LLM cache: {hits} hits ({cache.stats['memory_hits']} mem / {cache.stats['disk_hits']} disk), "
+                       f"{cache.stats['misses']} misses, {cache.hit_rate():.0%} hit rate")
+            per_agent = get_telemetry().summary()
+            if per_agent:
+                st.dataframe([{"agent": name, "calls": a["calls"], "p50 (s)": round(a["p50"], 3), "p95 (s)": round(a["p95"], 3),
+                               "errors": f"{a['error_rate']:.0%}", "~prompt tokens": a["prompt_tokens"]}
+                              for name, a in sorted(per_agent.items())], hide_index=True)
+                if st.button("Export traces"):
+                    st.caption(f"Wrote {get_telemetry().export_jsonl(TRACE_FILE)} spans to {TRACE_FILE}")
+                st.download_button("Prometheus snapshot", get_telemetry().prometheus_text(), file_name="metrics.prom")
+            for name, r in st.session_state.get("context_reports", {}).items():
+                st.caption(f"📦 {name} context: {r['used']:,}/{r['budget']:,} tokens, "
+                           f"{len(r['included'])} segments in, {len(r['dropped'])} dropped")
+            tiers = m.get("grading_tiers", {})
+            if tiers:
+                st.caption("🧮 Grading: " + ", ".join(f"{name} {t['count']} ({t['avg_latency'] * 1000:.0f} ms avg)" for name, t in tiers.items()))
+            p_hits, p_misses = m.get("prefetch_hits", 0), m.get("prefetch_misses", 0)
+            p_rate = p_hits / (p_hits + p_misses) if (p_hits + p_misses) else 0.0
+            st.caption(f"⚡ Question prefetch: {QuestionPrefetcher().depth()} ready, {p_rate:.0%} hit rate ({p_hits}/{p_hits + p_misses})")
+            bank = get_question_bank().stats()
+            st.caption(f"🔁 Question bank: {bank['questions']} questions, {bank['due']} due for review · "
+                       f"{m.get('bank_hits', 0)} served without an LLM call, {m.get('bank_duplicates', 0)} near-duplicates dropped")
             if st.session_state.chat_summary:
                 st.caption("✅ Context Compressed (Summary Active)")
 
@@ -359,20 +828,23 @@ def main():
     # --- MODE 1: CHAT ---
     if app_mode == "Ask Anything (Chat)":
         st.caption("Build your knowledge base through conversation.")
-        for msg in st.session_state.chat_history:
-            with st.chat_message(msg["role"]): st.markdown(msg["content"])
+        render_chat_history()
         if user_query := st.chat_input("Ask a question..."):
+            # Context first, so the new question is not counted twice (it is reserved as the query)
+            context = get_study_context(["Uploaded PDF(s)", "My Chat History"], query=user_query, agent="HybridQA_Agent")
             st.session_state.chat_history.append({"role": "user", "content": user_query})
             with st.chat_message("user"): st.markdown(user_query)
             with st.chat_message("assistant"):
                 agent = HybridQA_Agent()
-                with st.spinner("Thinking..."):
-                    start = time.time()
-                    response = agent.answer_question(user_query, st.session_state.rag_docs)
-                    ObservabilityTool().log_metric("HybridQA_Agent", start)
-                    st.markdown(response)
-                    st.session_state.chat_history.append({"role": "assistant", "content": response})
-                    SessionManager.save_state() # Save chat
+                # Render chunks as they arrive; history is appended and saved once the stream ends
+                chunks = agent.answer_question_stream(user_query, context)
+                try:
+                    response = st.write_stream(ObservabilityTool().track_stream("HybridQA_Agent", chunks))
+                    st.session_state.chat_history.append({"role": "assistant", "content": response.strip()})
+                except Exception as e:
+                    logging.error(f"Chat answer failed: {e}") # Retries and the deadline are already spent
+                    st.error("❌ The model is unavailable right now. Please ask again in a moment.")
+                SessionManager.save_state() # Save chat
 
     # --- MODE 2: EXAM PREP ---
     elif app_mode == "Quiz Me (Exam Prep)":
@@ -387,17 +859,7 @@ def main():
             with col3:
                 q_type = st.radio("Type", ["Text-Based", "Multiple Choice (MCQ)"])
 
-        if st.session_state.quiz_history:
-            st.markdown("#### 📜 Past Questions")
-            for i, item in enumerate(reversed(st.session_state.quiz_history)):
-                icon = "✅" if item['correct'] else "❌"
-                with st.expander(f"{icon} Q: {item['question'][:60]}..."):
-                    st.markdown(f"**Question:** {item['question']}")
-                    st.markdown(f"**Your Answer:** {item['user_answer']}")
-                    if not item['correct']:
-                        st.error(f"**Correct Answer:** {item['correct_answer']}")
-                    st.caption(f"**Feedback:** {item['feedback']}")
-            st.divider()
+        render_quiz_history()
 
         if st.session_state.quiz_data is None:
             if st.button("🚀 Start Quiz", type="primary"):
@@ -405,6 +867,8 @@ def main():
         else:
             q_text = st.session_state.quiz_data['question']
             st.markdown(f"### ❓ {q_text}")
+            if st.session_state.quiz_review:
+                st.caption("🔁 Review: you have seen this question before")
 
             if st.session_state.active_hint:
                 st.info(f"💡 **Hint:** {st.session_state.active_hint}")
@@ -436,30 +900,31 @@ def main():
                             st.session_state.quiz_last_explanation = explanation
                         else:
                             st.session_state.current_user_answer = user_text
-                            grader = GraderAgent()
-                            context = get_study_context(sources)
                             with st.spinner("Grading..."):
-                                res = grader.grade(q_text, user_text, model_answer, context)
-                                correct = "IS_CORRECT: Yes" in res
-                                feedback = res
-                                ObservabilityTool().log_metric("GraderAgent", start)
-                        
-                        if correct: st.session_state.score += 1
-                        st.session_state.last_feedback = feedback
-                        st.session_state.quiz_answered = True
-                        SessionManager.save_state() # Save after answer
-                        st.rerun()
+                                try:
+                                    correct, feedback = TieredGrader().grade(q_text, user_text, model_answer, sources)
+                                except Exception as e:
+                                    logging.error(f"Grading failed: {e}")
+                                    st.error("❌ The Grader is unavailable right now. Your answer is still here: please submit again.")
+                                    feedback = None # Stay unanswered so the student can resubmit
+
+                        if feedback is not None:
+                            if correct: st.session_state.score += 1
+                            st.session_state.last_feedback = feedback
+                            st.session_state.quiz_answered = True
+                            SessionManager.save_state() # Save after answer
+                            st.rerun()
 
                 with c2: 
                     if st.button("💡 Get Hint"):
-                        tutor = TutorAgent()
-                        context = get_study_context(sources)
                         with st.spinner("Consulting Tutor..."):
-                            start = time.time()
-                            hint = tutor.generate_hint(q_text, context)
-                            ObservabilityTool().log_metric("TutorAgent", start)
-                            st.session_state.active_hint = hint
-                            st.rerun()
+                            try:
+                                st.session_state.active_hint = get_hint(sources, q_text)
+                            except Exception as e:
+                                logging.error(f"Hint failed: {e}")
+                                st.error("❌ The Tutor is unavailable right now. Please try again.")
+                            else:
+                                st.rerun()
 
                 with c3: 
                     if st.button("⏩ Skip Question"):
@@ -492,4 +957,7 @@ def main():
                     generate_new_question(sources, difficulty, q_type)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    try:
+        main()
+    finally:
+        SessionManager.flush() # One batched write per script run (also on st.rerun)
\ No newline at end of file
@@ -0,0 +1,123 @@
+import json
+import math
+import threading
+import time
+from collections import deque
+
+# Fixed latency buckets (seconds); the last one catches everything slower
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0, math.inf)
+
+
+class Histogram:
+    """Fixed-bucket histogram; percentiles are interpolated inside the matching bucket."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, upper in enumerate(self.buckets):
+            if value <= upper:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, q):
+        if not self.count: return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if seen + c >= rank and c:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i]
+                if math.isinf(upper): return lower
+                return lower + (upper - lower) * (rank - seen) / c
+            seen += c
+        return self.buckets[-2]
+
+
+class Telemetry:
+    """
+    In-memory instrumentation for model calls: a bounded ring buffer of span records,
+    per-agent latency histograms and counters. Recording never touches disk; traces
+    are written out only by export_jsonl() and prometheus_text() is built on demand.
+    """
+
+    def __init__(self, ring_size=1000):
+        self._lock = threading.Lock()
+        self.spans = deque(maxlen=ring_size)
+        self.histograms = {}
+        self.ttft = {}
+        self.counters = {}
+        self._exported = 0  # spans recorded before this sequence number are already in the trace file
+        self._seq = 0
+
+    def record(self, agent, duration, prompt_chars=0, response_chars=0, ok=True, error=None, cache_hit=False, ttft=None, **extra):
+        span = {"agent": agent or "unknown", "start": time.time() - duration,
+                "duration": round(duration, 6), "prompt_chars": prompt_chars,
+                "prompt_tokens_est": estimate_tokens_from_chars(prompt_chars),
+                "response_chars": response_chars, "ok": ok, "error": error, "cache_hit": cache_hit}
+        if ttft is not None: span["ttft"] = round(ttft, 6)
+        span.update(extra)
+        with self._lock:
+            self._seq += 1
+            span["seq"] = self._seq
+            self.spans.append(span)
+            name = span["agent"]
+            self.histograms.setdefault(name, Histogram()).observe(duration)
+            if ttft is not None: self.ttft.setdefault(name, Histogram()).observe(ttft)
+            c = self.counters.setdefault(name, {"calls": 0, "errors": 0, "cache_hits": 0, "prompt_tokens": 0, "response_chars": 0})
+            c["calls"] += 1
+            c["errors"] += 0 if ok else 1
+            c["cache_hits"] += 1 if cache_hit else 0
+            c["prompt_tokens"] += span["prompt_tokens_est"]
+            c["response_chars"] += response_chars
+        return span
+
+    def summary(self):
+        """Per-agent {calls, errors, error_rate, p50, p95, p99, ...} for the dashboard."""
+        with self._lock:
+            out = {}
+            for name, hist in self.histograms.items():
+                c = self.counters[name]
+                out[name] = dict(c, error_rate=c["errors"] / c["calls"] if c["calls"] else 0.0,
+                                 p50=hist.percentile(0.50), p95=hist.percentile(0.95), p99=hist.percentile(0.99))
+                if name in self.ttft:
+                    out[name]["ttft_p50"] = self.ttft[name].percentile(0.50)
+            return out
+
+    def export_jsonl(self, path):
+        """Appends spans not exported yet to a JSONL trace file. Returns how many were written."""
+        with self._lock:
+            new = [s for s in self.spans if s["seq"] > self._exported]
+            if new: self._exported = new[-1]["seq"]
+        if new:
+            with open(path, "a") as f:
+                f.writelines(json.dumps(s) + "\n" for s in new)
+        return len(new)
+
+    def prometheus_text(self):
+        """Snapshot in the Prometheus text exposition format."""
+        lines = ["# TYPE agent_call_duration_seconds histogram"]
+        with self._lock:
+            for name, hist in sorted(self.histograms.items()):
+                cumulative = 0
+                for upper, count in zip(hist.buckets, hist.counts):
+                    cumulative += count
+                    le = "+Inf" if math.isinf(upper) else repr(upper)
+                    lines.append(f'agent_call_duration_seconds_bucket{{agent="{name}",le="{le}"}} {cumulative}')
+                lines.append(f'agent_call_duration_seconds_sum{{agent="{name}"}} {hist.sum:.6f}')
+                lines.append(f'agent_call_duration_seconds_count{{agent="{name}"}} {hist.count}')
+            for metric in ("calls", "errors", "cache_hits", "prompt_tokens", "response_chars"):
+                lines.append(f"# TYPE agent_{metric}_total counter")
+                for name, c in sorted(self.counters.items()):
+                    lines.append(f'agent_{metric}_total{{agent="{name}"}} {c[metric]}')
+        return "\n".join(lines) + "\n"
+
+
+def estimate_tokens_from_chars(chars):
+    """Rough Gemini token estimate (~4 characters per token for English text)."""
+    return (chars + 3) // 4
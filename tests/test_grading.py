@@ -0,0 +1,59 @@
+import pytest
+
+from grading import LocalGrader, parse_grader_reply
+
+# (student answer, answer key, expected verdict): True/False is decided locally, None goes to GraderAgent.
+# Mostly answers a statistics student actually gets wrong: none of them may be accepted locally.
+CASES = [
+    # One token away from the key
+    ("Type II error", "Type I error", None),
+    ("independent", "dependent", None),
+    ("variance rather than standard deviation", "standard deviation", None),
+    ("two-tailed test", "one-tailed test", None),
+    ("unbiased", "biased", None),
+    ("not significant", "significant", None),
+    # Operators and signs
+    ("p > 0.05", "p < 0.05", None),
+    ("n+1", "n-1", None),
+    ("1.96", "-1.96", False),
+    ("mu != 50", "mu = 50", None),
+    ("mu = 50", "mu ≠ 50", None),
+    ("5%", "5", False),
+    # Words qualifying a number
+    ("not 0.05", "0.05", None),
+    ("less than 5", "greater than 5", None),
+    ("at most 3", "at least 3", None),
+    ("mu > 50", "H0: mu = 50", None),
+    # Tolerance follows the key's precision; integers are exact
+    ("1945", "1939", False),
+    ("1930", "1939", False),
+    ("198", "n = 200", False),
+    ("1.97", "1.96", False),
+    ("1.955", "1.96", True),
+    ("3.14", "3.14159", None),
+    # Still decided locally
+    ("The null hypothesis", "null hypothesis", True),
+    ("error type I", "Type I error", True),
+    ("n - 1", "n-1", True),
+    ("50", "H0: mu = 50", True),
+    ("49", "H0: mu = 50", False),
+    ("-1.96", "z = -1.96", True),
+    ("5%", "0.05", True),
+    ("1939 to 1945", "1939-1945", True),
+    ("1914-1918", "1939-1945", None),
+    ("idk", "standard error", False),
+]
+
+
+@pytest.mark.parametrize("answer, key, expected", CASES)
+def test_local_verdict(answer, key, expected):
+    assert LocalGrader().score(answer, key)[0] is expected
+
+
+@pytest.mark.parametrize("reply, expected", [
+    ("IS_CORRECT: Yes | EXPLANATION: Matches.", True),
+    ("is correct - no. EXPLANATION: wrong sign", False),
+    ("I think the student is probably right.", None),
+])
+def test_grader_reply(reply, expected):
+    assert parse_grader_reply(reply)[0] is expected
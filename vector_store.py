@@ -0,0 +1,122 @@
+import json
+import hashlib
+import logging
+import os
+import re
+
+import numpy as np
+
+TOKEN = re.compile(r"[a-z0-9]+")
+
+
+class HashingEmbedder:
+    """
+    Deterministic offline embedder (feature hashing of words + word bigrams).
+    No network, no model download: the same text always maps to the same vector.
+    """
+
+    def __init__(self, dim=384):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _bucket(self, feature):
+        h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+        return h % self.dim, (1.0 if (h >> 63) & 1 else -1.0)
+
+    def __call__(self, texts):
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = TOKEN.findall(text.lower())
+            feats = words + [a + "_" + b for a, b in zip(words, words[1:])]
+            counts = {}
+            for feat in feats:
+                counts[feat] = counts.get(feat, 0) + 1
+            for feat, tf in counts.items():
+                col, sign = self._bucket(feat)
+                out[row, col] += sign * (1.0 + np.log(tf))
+        return out
+
+
+class VectorStore:
+    """
+    Dense embedding store: one contiguous float32 matrix (rows L2-normalised)
+    plus parallel id / metadata lists. Persists as <path>.npy + <path>.meta.json
+    and reopens the matrix memory-mapped, so startup never re-embeds.
+
+    `embed_fn` is any callable mapping a list of strings to an (n, dim) array,
+    so HashingEmbedder can be swapped for a hosted embedding model.
+    """
+
+    def __init__(self, embed_fn=None, dim=None):
+        self.embed_fn = embed_fn or HashingEmbedder(dim or 384)
+        self.dim = dim or getattr(self.embed_fn, "dim", None)
+        self.matrix = np.zeros((0, self.dim or 0), dtype=np.float32)
+        self.ids = []
+        self.metadata = []
+        self.fingerprint = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    @staticmethod
+    def _normalise(mat):
+        mat = np.asarray(mat, dtype=np.float32)
+        norms = np.linalg.norm(mat, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return mat / norms
+
+    def add(self, ids, texts, metadata=None, batch_size=256):
+        """Embeds texts in batches and appends them to the matrix."""
+        metadata = metadata or [{} for _ in ids]
+        blocks = []
+        for i in range(0, len(texts), batch_size):
+            blocks.append(self._normalise(self.embed_fn(texts[i:i + batch_size])))
+        if not blocks: return self
+        new = np.vstack(blocks)
+        self.dim = new.shape[1]
+        base = self.matrix if len(self.matrix) else np.zeros((0, self.dim), dtype=np.float32)
+        self.matrix = np.ascontiguousarray(np.vstack([base, new]), dtype=np.float32)
+        self.ids.extend(ids)
+        self.metadata.extend(metadata)
+        return self
+
+    def search(self, queries, top_k=6):
+        """
+        Batched cosine top-k. `queries` is a list of strings (or a pre-embedded matrix).
+        Returns one [(id, score, metadata), ...] list per query, best first.
+        """
+        if not len(self.ids): return [[] for _ in queries]
+        q = queries if isinstance(queries, np.ndarray) else self.embed_fn(list(queries))
+        scores = self._normalise(q) @ self.matrix.T
+        k = min(top_k, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for row, cols in enumerate(top):
+            cols = cols[np.argsort(-scores[row, cols])]
+            results.append([(self.ids[c], float(scores[row, c]), self.metadata[c]) for c in cols])
+        return results
+
+    def save(self, path):
+        tmp = path + ".tmp.npy"
+        np.save(tmp, self.matrix)
+        os.replace(tmp, path + ".npy")
+        meta = {"ids": self.ids, "metadata": self.metadata, "fingerprint": self.fingerprint,
+                "dim": self.dim, "embedder": getattr(self.embed_fn, "name", "custom")}
+        with open(path + ".meta.json.tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(path + ".meta.json.tmp", path + ".meta.json")
+
+    @classmethod
+    def load(cls, path, embed_fn=None, mmap=True):
+        with open(path + ".meta.json", "r") as f:
+            meta = json.load(f)
+        store = cls(embed_fn, meta["dim"])
+        store.matrix = np.load(path + ".npy", mmap_mode="r" if mmap else None)
+        store.ids = meta["ids"]
+        store.metadata = meta["metadata"]
+        store.fingerprint = meta.get("fingerprint")
+        if getattr(store.embed_fn, "name", "custom") != meta.get("embedder"):
+            # Vectors from another embedder are not comparable: mark stale so callers rebuild
+            logging.warning(f"Vector store at {path} was built with {meta.get('embedder')}")
+            store.fingerprint = None
+        return store